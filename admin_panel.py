@@ -11,6 +11,120 @@ from auth import AuthManager
 from analytics import show_admin_analytics
 
 
+# Cached read-only queries. Reruns within the TTL are served from memory;
+# mutations below clear the affected helpers so changes show up immediately.
+@st.cache_data(ttl=30, show_spinner=False)
+def _fetch_user_stats() -> dict:
+    """Fetch user counters for the Users tab."""
+    with db.get_connection() as conn:
+        user_stats = conn.execute("""
+            SELECT 
+                COUNT(*) as total_users,
+                COUNT(*) FILTER (WHERE is_active = 1) as active_users,
+                COUNT(*) FILTER (WHERE role = 'admin') as admin_users,
+                COUNT(*) FILTER (WHERE role = 'student') as student_users
+            FROM users
+        """).fetchone()
+    return dict(user_stats)
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _fetch_users_df(filter_role: str = "All", filter_status: str = "All") -> pd.DataFrame:
+    """Fetch the users matching the role/status filters, newest accounts first."""
+    where = []
+    params = []
+    if filter_role != "All":
+        where.append("role = ?")
+        params.append(filter_role)
+    if filter_status != "All":
+        where.append("is_active = ?")
+        params.append(1 if filter_status == "Active" else 0)
+    where_clause = f"WHERE {' AND '.join(where)}" if where else ""
+    
+    with db.get_connection() as conn:
+        return pd.read_sql_query(f"""
+            SELECT id, username, email, full_name, role, is_active, 
+                   created_at, last_login
+            FROM users
+            {where_clause}
+            ORDER BY created_at DESC
+        """, conn, params=params)
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _fetch_content_overview() -> tuple:
+    """Fetch lesson counters and the lesson list over one connection."""
+    with db.get_connection() as conn:
+        content_stats = conn.execute("""
+            SELECT
+                (SELECT COUNT(*) FROM lessons) as total_lessons,
+                (SELECT COUNT(*) FROM quiz_attempts
+                 WHERE created_at >= datetime('now', '-7 days')) as recent_quizzes
+        """).fetchone()
+
+        lessons_df = pd.read_sql_query("""
+            SELECT lesson_no, title, 
+                   LENGTH(content) as content_length,
+                   created_at, updated_at
+            FROM lessons
+            ORDER BY lesson_no_int
+        """, conn)
+    return dict(content_stats), lessons_df
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _fetch_system_stats() -> dict:
+    """Fetch table counts for the System Information panel."""
+    with db.get_connection() as conn:
+        db_stats = conn.execute("""
+            SELECT 
+                (SELECT COUNT(*) FROM users) as total_users,
+                (SELECT COUNT(*) FROM lessons) as total_lessons,
+                (SELECT COUNT(*) FROM quiz_attempts) as total_quiz_attempts,
+                (SELECT COUNT(*) FROM qa_history) as total_qa_interactions,
+                (SELECT COUNT(*) FROM sessions) as active_sessions
+        """).fetchone()
+    return dict(db_stats)
+
+
+def _clear_user_caches():
+    """Drop cached user data after a user mutation."""
+    _fetch_user_stats.clear()
+    _fetch_users_df.clear()
+    _fetch_system_stats.clear()
+    st.session_state.pop('users_df', None)
+
+
+def _load_users_df(filter_role: str, filter_status: str) -> pd.DataFrame:
+    """Return the filtered user list, reusing the session's copy while the filters are unchanged."""
+    filters = (filter_role, filter_status)
+    if 'users_df' not in st.session_state or st.session_state.get('users_df_filters') != filters:
+        st.session_state['users_df'] = _fetch_users_df(filter_role, filter_status)
+        st.session_state['users_df_filters'] = filters
+    return st.session_state['users_df']
+
+
+def _patch_users_df(users_df: pd.DataFrame, edits: list, filter_role: str, filter_status: str) -> pd.DataFrame:
+    """Apply saved edits to the session's user list in place of re-fetching it."""
+    for edit in edits:
+        mask = users_df['id'] == edit['user_id']
+        users_df.loc[mask, 'role'] = edit['role']
+        users_df.loc[mask, 'is_active'] = edit['is_active']
+    
+    # Drop users the edits moved out of the current filters
+    if filter_role != "All":
+        users_df = users_df[users_df['role'] == filter_role]
+    if filter_status != "All":
+        users_df = users_df[users_df['is_active'] == (1 if filter_status == "Active" else 0)]
+    return users_df.reset_index(drop=True)
+
+
+def _clear_content_caches():
+    """Drop cached lesson data after a content mutation."""
+    _fetch_content_overview.clear()
+    _fetch_system_stats.clear()
+
+
 def show_admin_panel():
     """Display the admin panel."""
     user = AuthManager.get_current_user()
@@ -37,20 +151,13 @@ def show_admin_panel():
         show_system_settings()
 
 
+@st.fragment
 def show_user_management():
     """User management interface."""
     st.subheader("👥 User Management")
     
     # User statistics
-    with db.get_connection() as conn:
-        user_stats = conn.execute("""
-            SELECT 
-                COUNT(*) as total_users,
-                SUM(CASE WHEN is_active = 1 THEN 1 ELSE 0 END) as active_users,
-                SUM(CASE WHEN role = 'admin' THEN 1 ELSE 0 END) as admin_users,
-                SUM(CASE WHEN role = 'student' THEN 1 ELSE 0 END) as student_users
-            FROM users
-        """).fetchone()
+    user_stats = _fetch_user_stats()
     
     col1, col2, col3, col4 = st.columns(4)
     with col1:
@@ -80,9 +187,10 @@ def show_user_management():
                 user_id = db.create_user(new_username, new_password, new_email, new_full_name)
                 if user_id:
                     # Set role
-                    with db.get_connection() as conn:
+                    with db.get_connection(write=True) as conn:
                         conn.execute("UPDATE users SET role = ? WHERE id = ?", (new_role, user_id))
                         conn.commit()
+                    _clear_user_caches()
                     st.success(f"✅ User '{new_username}' created successfully!")
                 else:
                     st.error("❌ Failed to create user. Username may already exist.")
@@ -92,115 +200,109 @@ def show_user_management():
     # User list and management
     st.subheader("👥 User List")
     
-    with db.get_connection() as conn:
-        users = conn.execute("""
-            SELECT id, username, email, full_name, role, is_active, 
-                   created_at, last_login
-            FROM users
-            ORDER BY created_at DESC
-        """).fetchall()
+    # User filter
+    filter_role = st.selectbox("Filter by Role", ["All", "admin", "student"])
+    filter_status = st.selectbox("Filter by Status", ["All", "Active", "Inactive"])
     
-    if users:
-        users_df = pd.DataFrame([dict(user) for user in users])
-        
-        # User filter
-        filter_role = st.selectbox("Filter by Role", ["All", "admin", "student"])
-        filter_status = st.selectbox("Filter by Status", ["All", "Active", "Inactive"])
-        
-        filtered_df = users_df.copy()
-        if filter_role != "All":
-            filtered_df = filtered_df[filtered_df['role'] == filter_role]
-        if filter_status == "Active":
-            filtered_df = filtered_df[filtered_df['is_active'] == 1]
-        elif filter_status == "Inactive":
-            filtered_df = filtered_df[filtered_df['is_active'] == 0]
-        
+    filtered_df = _load_users_df(filter_role, filter_status)
+    
+    # Edits are queued per user and written together on "Apply Changes"
+    pending_edits = st.session_state.setdefault('pending_user_edits', {})
+    
+    if filtered_df.empty:
+        st.info("No users match the selected filters.")
+    else:
         st.dataframe(filtered_df, use_container_width=True)
         
         # User actions
         st.subheader("🔧 User Actions")
-        selected_username = st.selectbox("Select User", filtered_df['username'].tolist())
+        usernames = filtered_df['username'].tolist()
+        selected_username = st.selectbox("Select User", usernames)
         
         if selected_username:
-            selected_user = filtered_df[filtered_df['username'] == selected_username].iloc[0]
+            # Positional lookup; usernames are unique, so no mask over the frame is needed
+            selected_user = filtered_df.iloc[usernames.index(selected_username)]
+            user_id = int(selected_user['id'])
+            edit = pending_edits.get(user_id, {
+                'user_id': user_id,
+                'username': selected_username,
+                'role': selected_user['role'],
+                'is_active': int(selected_user['is_active']),
+                'password': None,
+            })
             
             col1, col2, col3 = st.columns(3)
             
             with col1:
                 if st.button("🔄 Reset Password"):
-                    new_pass = f"temp{selected_user['id']}123"
-                    # Hash and update password
-                    import hashlib
-                    password_hash = hashlib.sha256(new_pass.encode()).hexdigest()
-                    
-                    with db.get_connection() as conn:
-                        conn.execute("UPDATE users SET password_hash = ? WHERE id = ?", 
-                                   (password_hash, selected_user['id']))
-                        conn.commit()
+                    edit['password'] = f"temp{user_id}123"
+                    pending_edits[user_id] = edit
                     
-                    st.success(f"Password reset to: {new_pass}")
+                    st.success(f"Password will be reset to: {edit['password']}")
             
             with col2:
-                current_status = "Active" if selected_user['is_active'] else "Inactive"
-                new_status = "Inactive" if selected_user['is_active'] else "Active"
+                new_status = "Inactive" if edit['is_active'] else "Active"
                 
                 if st.button(f"Toggle to {new_status}"):
-                    new_is_active = 0 if selected_user['is_active'] else 1
-                    
-                    with db.get_connection() as conn:
-                        conn.execute("UPDATE users SET is_active = ? WHERE id = ?", 
-                                   (new_is_active, selected_user['id']))
-                        conn.commit()
-                    
-                    st.success(f"User status changed to {new_status}")
-                    st.rerun()
+                    edit['is_active'] = 0 if edit['is_active'] else 1
+                    pending_edits[user_id] = edit
+                    st.rerun(scope="fragment")
             
             with col3:
-                new_role = "admin" if selected_user['role'] == "student" else "student"
+                new_role = "admin" if edit['role'] == "student" else "student"
                 if st.button(f"Change to {new_role}"):
-                    with db.get_connection() as conn:
-                        conn.execute("UPDATE users SET role = ? WHERE id = ?", 
-                                   (new_role, selected_user['id']))
-                        conn.commit()
-                    
-                    st.success(f"User role changed to {new_role}")
-                    st.rerun()
+                    edit['role'] = new_role
+                    pending_edits[user_id] = edit
+                    st.rerun(scope="fragment")
+    
+    if pending_edits:
+        st.subheader("📝 Pending Changes")
+        st.dataframe(pd.DataFrame([
+            {
+                'username': edit['username'],
+                'role': edit['role'],
+                'status': "Active" if edit['is_active'] else "Inactive",
+                'password_reset': bool(edit['password']),
+            }
+            for edit in pending_edits.values()
+        ]), use_container_width=True)
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("✅ Apply Changes", type="primary"):
+                edits = list(pending_edits.values())
+                db.apply_user_edits(edits)
+                pending_edits.clear()
+                _clear_user_caches()
+                # Keep this session's list current without another SELECT
+                st.session_state['users_df'] = _patch_users_df(filtered_df, edits, filter_role, filter_status)
+                
+                st.toast("User changes applied")
+                st.rerun(scope="fragment")
+        with col2:
+            if st.button("↩️ Discard Changes"):
+                pending_edits.clear()
+                st.rerun(scope="fragment")
 
 
+@st.fragment
 def show_content_management():
     """Content management interface."""
     st.subheader("📚 Content Management")
     
     # Lesson statistics
-    with db.get_connection() as conn:
-        lesson_count = conn.execute("SELECT COUNT(*) as count FROM lessons").fetchone()
-        
-        recent_activity = conn.execute("""
-            SELECT COUNT(*) as recent_quizzes
-            FROM quiz_attempts
-            WHERE created_at >= datetime('now', '-7 days')
-        """).fetchone()
-    
+    content_stats, lessons_df = _fetch_content_overview()
+
     col1, col2 = st.columns(2)
     with col1:
-        st.metric("Total Lessons", lesson_count['count'])
+        st.metric("Total Lessons", content_stats['total_lessons'])
     with col2:
-        st.metric("Quiz Attempts (7d)", recent_activity['recent_quizzes'])
-    
+        st.metric("Quiz Attempts (7d)", content_stats['recent_quizzes'])
+
     # Lesson management
     st.subheader("📝 Lessons")
-    
-    with db.get_connection() as conn:
-        lessons = conn.execute("""
-            SELECT lesson_no, title, 
-                   LENGTH(content) as content_length,
-                   created_at, updated_at
-            FROM lessons
-            ORDER BY CAST(lesson_no AS INTEGER)
-        """).fetchall()
-    
-    if lessons:
-        lessons_df = pd.DataFrame([dict(lesson) for lesson in lessons])
+
+    if not lessons_df.empty:
         st.dataframe(lessons_df, use_container_width=True)
         
         # Add new lesson
@@ -217,12 +319,13 @@ def show_content_management():
             if st.form_submit_button("Add Lesson"):
                 if lesson_no and lesson_title and lesson_content:
                     try:
-                        with db.get_connection() as conn:
+                        with db.get_connection(write=True) as conn:
                             conn.execute("""
                                 INSERT INTO lessons (lesson_no, title, content)
                                 VALUES (?, ?, ?)
                             """, (lesson_no, lesson_title, lesson_content))
                             conn.commit()
+                        _clear_content_caches()
                         st.success("✅ Lesson added successfully!")
                         st.rerun()
                     except Exception as e:
@@ -239,6 +342,7 @@ def show_content_management():
         if st.button("📥 Import from CSV"):
             success = db.migrate_lessons_from_csv("lessons.csv")
             if success:
+                _clear_content_caches()
                 st.success("✅ Lessons imported from CSV successfully!")
                 st.rerun()
             else:
@@ -247,28 +351,29 @@ def show_content_management():
     with col2:
         if st.button("🗑️ Clear All Lessons"):
             if st.checkbox("I understand this will delete all lesson data"):
-                with db.get_connection() as conn:
+                with db.get_connection(write=True) as conn:
                     conn.execute("DELETE FROM lessons")
                     conn.commit()
+                _clear_content_caches()
                 st.success("✅ All lessons cleared.")
                 st.rerun()
 
 
+@st.fragment
 def show_system_settings():
     """System settings interface."""
     st.subheader("⚙️ System Settings")
     
     # Current settings
     with db.get_connection() as conn:
-        settings = conn.execute("""
+        settings_df = pd.read_sql_query("""
             SELECT key, value, description, updated_at
             FROM system_settings
             ORDER BY key
-        """).fetchall()
+        """, conn)
     
-    if settings:
+    if not settings_df.empty:
         st.subheader("Current Settings")
-        settings_df = pd.DataFrame([dict(setting) for setting in settings])
         st.dataframe(settings_df, use_container_width=True)
     
     # Update settings
@@ -288,23 +393,15 @@ def show_system_settings():
             if setting_key and setting_value:
                 db.set_system_setting(setting_key, setting_value, setting_description)
                 st.success(f"✅ Setting '{setting_key}' updated successfully!")
-                st.rerun()
+                st.rerun(scope="fragment")
             else:
                 st.error("❌ Key and value are required.")
     
     # System information
     st.subheader("📊 System Information")
     
-    with db.get_connection() as conn:
-        # Database size and statistics
-        db_stats = conn.execute("""
-            SELECT 
-                (SELECT COUNT(*) FROM users) as total_users,
-                (SELECT COUNT(*) FROM lessons) as total_lessons,
-                (SELECT COUNT(*) FROM quiz_attempts) as total_quiz_attempts,
-                (SELECT COUNT(*) FROM qa_history) as total_qa_interactions,
-                (SELECT COUNT(*) FROM sessions) as active_sessions
-        """).fetchone()
+    # Database size and statistics
+    db_stats = _fetch_system_stats()
     
     info_col1, info_col2 = st.columns(2)
     
@@ -325,21 +422,27 @@ def show_system_settings():
     with col1:
         if st.button("🧹 Cleanup Expired Sessions"):
             db.cleanup_expired_sessions()
+            _fetch_system_stats.clear()
             st.success("✅ Expired sessions cleaned up!")
     
     with col2:
         if st.button("📈 Rebuild Indexes"):
-            with db.get_connection() as conn:
+            with db.get_connection(write=True) as conn:
                 conn.execute("ANALYZE")
                 conn.commit()
             st.success("✅ Database indexes rebuilt!")
     
     with col3:
         if st.button("💾 Backup Database"):
-            import shutil
-            import os
+            import sqlite3
             backup_path = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
-            shutil.copy2(db.db_path, backup_path)
+            # Online backup copies pages in steps, so concurrent writers can't corrupt it
+            backup_conn = sqlite3.connect(backup_path)
+            try:
+                with db.get_connection() as conn:
+                    conn.backup(backup_conn, pages=1024, sleep=0.05)
+            finally:
+                backup_conn.close()
             st.success(f"✅ Database backed up to {backup_path}")
 
 
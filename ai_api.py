@@ -4,51 +4,108 @@ Supports both OpenAI and DeepSeek APIs with intelligent caching for better perfo
 """
 
 import time
+import orjson
 import requests
 import hashlib
-import json
 import sqlite3
-from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterator, Optional, Tuple, Union
 from config import config
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
 
+# Cache statements, kept as constants so sqlite3's statement cache reuses them
+_CACHE_GET_SQL = """
+    SELECT response, expires_at FROM api_cache
+    WHERE cache_key = ? AND expires_at > ?
+"""
+_CACHE_SET_SQL = """
+    INSERT OR REPLACE INTO api_cache (cache_key, response, expires_at)
+    VALUES (?, ?, ?)
+"""
+_CACHE_CLEANUP_SQL = "DELETE FROM api_cache WHERE expires_at <= ?"
+
+
 class APICache:
-    """Simple SQLite-based cache for API responses."""
+    """SQLite-backed cache for API responses with an in-memory LRU in front."""
+    
+    MEMORY_CACHE_SIZE = 1024
+    # Expired rows are purged and their pages returned to the OS this often
+    CLEANUP_INTERVAL_SECONDS = 10 * 60
+    VACUUM_PAGES_PER_CLEANUP = 1000
     
     def __init__(self, db_path: str = "api_cache.db"):
         self.db_path = db_path
+        # cache_key -> (response, expires_at as epoch seconds), oldest first
+        self._mem: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
         self._init_cache_db()
+        # Writes go through one background thread with its own connection
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="api-cache-writer",
+                                          initializer=self._init_writer)
+        self._schedule_cleanup()
+    
+    def _init_writer(self):
+        """Open the writer thread's connection."""
+        self._write_conn = sqlite3.connect(self.db_path, isolation_level=None)
+        self._apply_pragmas(self._write_conn)
+    
+    @staticmethod
+    def _apply_pragmas(conn: sqlite3.Connection):
+        """Per-connection settings; losing the last few cache writes on a crash is fine."""
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
     
     def _init_cache_db(self):
         """Initialize cache database."""
-        conn = sqlite3.connect(self.db_path)
-        conn.execute("""
+        # auto_vacuum only takes effect on an existing file after a VACUUM
+        if self._conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            self._conn.execute("VACUUM")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._apply_pragmas(self._conn)
+        
+        # Older caches stored expires_at as datetime text; the rows are
+        # disposable, so start a fresh table rather than converting them
+        columns = {row[1]: row[2] for row in self._conn.execute("PRAGMA table_info(api_cache)")}
+        if columns and columns.get("expires_at") != "INTEGER":
+            self._conn.execute("DROP TABLE api_cache")
+        
+        self._conn.execute("""
             CREATE TABLE IF NOT EXISTS api_cache (
                 cache_key TEXT PRIMARY KEY,
                 response TEXT NOT NULL,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                expires_at TIMESTAMP NOT NULL
+                expires_at INTEGER NOT NULL
             )
         """)
-        conn.execute("""
+        self._conn.execute("""
             CREATE INDEX IF NOT EXISTS idx_cache_expires ON api_cache (expires_at)
         """)
-        conn.commit()
-        conn.close()
+    
+    def _remember(self, cache_key: str, response: str, expires_at: int):
+        """Store an entry in the in-memory LRU, evicting the oldest if full."""
+        self._mem[cache_key] = (response, expires_at)
+        self._mem.move_to_end(cache_key)
+        if len(self._mem) > self.MEMORY_CACHE_SIZE:
+            self._mem.popitem(last=False)
     
     def _generate_cache_key(self, messages: List[Dict], model: str, temperature: float, max_tokens: int) -> str:
         """Generate cache key from request parameters."""
-        cache_data = {
-            "messages": messages,
-            "model": model,
-            "temperature": temperature,
-            "max_tokens": max_tokens
-        }
-        cache_string = json.dumps(cache_data, sort_keys=True)
-        return hashlib.md5(cache_string.encode()).hexdigest()
+        h = hashlib.blake2b(digest_size=16)
+        h.update(model.encode())
+        h.update(struct.pack('<dI', temperature, max_tokens))
+        for message in messages:
+            h.update(message['role'].encode())
+            h.update(b'\x00')
+            h.update(message['content'].encode())
+            h.update(b'\x01')
+        return h.hexdigest()
     
     def get(self, messages: List[Dict], model: str, temperature: float, max_tokens: int) -> Optional[str]:
         """Get cached response if available and not expired."""
@@ -57,49 +114,107 @@ class APICache:
         
         cache_key = self._generate_cache_key(messages, model, temperature, max_tokens)
         
-        conn = sqlite3.connect(self.db_path)
-        result = conn.execute("""
-            SELECT response FROM api_cache 
-            WHERE cache_key = ? AND expires_at > CURRENT_TIMESTAMP
-        """, (cache_key,)).fetchone()
-        conn.close()
-        
-        return result[0] if result else None
+        with self._lock:
+            entry = self._mem.get(cache_key)
+            if entry is not None:
+                response, expires_at = entry
+                if expires_at > time.time():
+                    self._mem.move_to_end(cache_key)
+                    return response
+                del self._mem[cache_key]
+            
+            result = self._conn.execute(_CACHE_GET_SQL, (cache_key, int(time.time()))).fetchone()
+            
+            if not result:
+                return None
+            
+            response, expires_at = result
+            self._remember(cache_key, response, expires_at)
+            return response
     
-    def set(self, messages: List[Dict], model: str, temperature: float, max_tokens: int, response: str):
-        """Cache the API response."""
+    def set(self, messages: List[Dict], model: str, temperature: float, max_tokens: int, response: str,
+            ttl_minutes: Optional[int] = None):
+        """Cache the API response for ttl_minutes (default: CACHE_DURATION_MINUTES)."""
         if not config.ENABLE_RESPONSE_CACHING:
             return
         
         cache_key = self._generate_cache_key(messages, model, temperature, max_tokens)
-        expires_at = datetime.now() + timedelta(minutes=config.CACHE_DURATION_MINUTES)
+        if ttl_minutes is None:
+            ttl_minutes = config.CACHE_DURATION_MINUTES
+        expires_at = int(time.time()) + ttl_minutes * 60
         
-        conn = sqlite3.connect(self.db_path)
-        conn.execute("""
-            INSERT OR REPLACE INTO api_cache (cache_key, response, expires_at)
-            VALUES (?, ?, ?)
-        """, (cache_key, response, expires_at))
-        conn.commit()
-        conn.close()
+        with self._lock:
+            self._remember(cache_key, response, expires_at)
+        self._writer.submit(self._do_set, cache_key, response, expires_at)
+    
+    def _do_set(self, cache_key: str, response: str, expires_at: int):
+        """Persist a cache entry (runs on the writer thread)."""
+        self._write_conn.execute(_CACHE_SET_SQL, (cache_key, response, expires_at))
     
     def cleanup_expired(self):
         """Remove expired cache entries."""
-        conn = sqlite3.connect(self.db_path)
-        conn.execute("DELETE FROM api_cache WHERE expires_at <= CURRENT_TIMESTAMP")
-        conn.commit()
-        conn.close()
+        now = int(time.time())
+        with self._lock:
+            for cache_key in [k for k, (_, expires_at) in self._mem.items() if expires_at <= now]:
+                del self._mem[cache_key]
+        self._writer.submit(self._do_cleanup, now)
+    
+    def _do_cleanup(self, now: int):
+        """Delete expired rows and release free pages (runs on the writer thread)."""
+        self._write_conn.execute(_CACHE_CLEANUP_SQL, (now,))
+        # execute() stops after one step (one page); executescript() runs it to completion
+        self._write_conn.executescript(f"PRAGMA incremental_vacuum({self.VACUUM_PAGES_PER_CLEANUP})")
+    
+    def _schedule_cleanup(self):
+        """Arm the timer for the next periodic cleanup."""
+        self._cleanup_timer = threading.Timer(self.CLEANUP_INTERVAL_SECONDS, self._periodic_cleanup)
+        self._cleanup_timer.daemon = True
+        self._cleanup_timer.start()
+    
+    def _periodic_cleanup(self):
+        """Timer callback: clean up, then schedule the next run."""
+        try:
+            self.cleanup_expired()
+        except RuntimeError:
+            return  # Writer already shut down at interpreter exit
+        self._schedule_cleanup()
+
+
+class _Flight:
+    """An API request in progress that identical requests can wait on."""
+    
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Optional[str] = None
 
 
 class AIAPIClient:
     """Enhanced AI API client with multi-provider support."""
     
+    # How long a duplicate request waits for the first one before going itself
+    INFLIGHT_WAIT_SECONDS = 60
+    
     def __init__(self):
         self.cache = APICache()
+        self._inflight: Dict[str, _Flight] = {}
+        self._inflight_lock = threading.Lock()
+        self._init_provider_settings()
         self._init_session()
     
+    def _init_provider_settings(self):
+        """Resolve the provider-dependent request settings once per process."""
+        self._is_openai = config.API_PROVIDER == "openai"
+        self._default_temperature = config.DEFAULT_TEMPERATURE
+        self._default_max_tokens = min(config.DEFAULT_MAX_TOKENS, 600)
+        # Set optimized timeouts (shorter for faster responses)
+        self._timeout = (5, 20) if self._is_openai else (8, 30)
+        self._api_url = config.CURRENT_API_URL
+    
     def _init_session(self):
         """Initialize HTTP session with retry strategy."""
         self.session = requests.Session()
+        # Auth and content-type are the same for every call, so they live on the session
+        self.session.headers.update(config.get_api_headers())
         
         retry_strategy = Retry(
             total=3,  # Reduced for faster response
@@ -110,29 +225,36 @@ class AIAPIClient:
             allowed_methods=["POST"]
         )
         
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        # Keep enough pooled keep-alive connections for concurrent sessions
+        adapter = HTTPAdapter(max_retries=retry_strategy, pool_connections=32, pool_maxsize=32)
         self.session.mount("https://", adapter)
     
     def _optimize_parameters_for_speed(self, temperature: float = None, max_tokens: int = None) -> tuple:
         """Optimize parameters for faster response while maintaining quality."""
         # For faster responses, we can slightly reduce max_tokens and adjust temperature
-        optimized_temp = temperature if temperature is not None else config.DEFAULT_TEMPERATURE
-        optimized_tokens = max_tokens if max_tokens is not None else min(config.DEFAULT_MAX_TOKENS, 600)
+        optimized_temp = temperature if temperature is not None else self._default_temperature
+        optimized_tokens = max_tokens if max_tokens is not None else self._default_max_tokens
         
         # For OpenAI, we can use more aggressive optimization
-        if config.API_PROVIDER == "openai":
+        if self._is_openai:
             optimized_tokens = min(optimized_tokens, 500)  # OpenAI is faster with fewer tokens
         
         return optimized_temp, optimized_tokens
     
-    def call_ai_api(self, messages: List[Dict[str, str]], temperature: float = None, max_tokens: int = None) -> str:
+    def call_ai_api(self, messages: List[Dict[str, str]], temperature: float = None, max_tokens: int = None,
+                    cache_ttl_minutes: Optional[int] = None, use_cache: bool = True) -> str:
         """
         Call AI API with caching and multi-provider support.
         
+        Identical requests already in flight from another session wait for
+        that call's answer instead of hitting the API a second time.
+        
         Args:
             messages: List of message dictionaries for the conversation
             temperature: Override default temperature (optional)
             max_tokens: Override default max tokens (optional)
+            cache_ttl_minutes: How long to cache the response (optional)
+            use_cache: Set False to skip the cache lookup and overwrite the entry
         
         Returns:
             AI response content
@@ -144,45 +266,67 @@ class AIAPIClient:
         opt_temperature, opt_max_tokens = self._optimize_parameters_for_speed(temperature, max_tokens)
         
         # Check cache first
-        cached_response = self.cache.get(messages, config.CURRENT_MODEL, opt_temperature, opt_max_tokens)
-        if cached_response:
-            return cached_response
+        if use_cache:
+            cached_response = self.cache.get(messages, config.CURRENT_MODEL, opt_temperature, opt_max_tokens)
+            if cached_response:
+                return cached_response
+        
+        cache_key = self.cache._generate_cache_key(messages, config.CURRENT_MODEL, opt_temperature, opt_max_tokens)
+        with self._inflight_lock:
+            flight = self._inflight.get(cache_key)
+            is_leader = flight is None
+            if is_leader:
+                flight = self._inflight[cache_key] = _Flight()
         
+        if not is_leader:
+            if flight.event.wait(self.INFLIGHT_WAIT_SECONDS) and flight.result is not None:
+                return flight.result
+            # The first caller failed or stalled; make the request ourselves
+            result = self._post_completion(messages, opt_temperature, opt_max_tokens)
+            self.cache.set(messages, config.CURRENT_MODEL, opt_temperature, opt_max_tokens, result,
+                           cache_ttl_minutes)
+            return result
+        
+        try:
+            result = self._post_completion(messages, opt_temperature, opt_max_tokens)
+            
+            # Cache the successful response
+            self.cache.set(messages, config.CURRENT_MODEL, opt_temperature, opt_max_tokens, result,
+                           cache_ttl_minutes)
+            
+            flight.result = result
+            return result
+        finally:
+            with self._inflight_lock:
+                del self._inflight[cache_key]
+            flight.event.set()
+    
+    def _post_completion(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> str:
+        """Send one chat completion request, retrying transient failures."""
         # Prepare API request
         payload = {
             "model": config.CURRENT_MODEL,
             "messages": messages,
-            "temperature": opt_temperature,
-            "max_tokens": opt_max_tokens
+            "temperature": temperature,
+            "max_tokens": max_tokens
         }
         
         # Add provider-specific optimizations
-        if config.API_PROVIDER == "openai":
+        if self._is_openai:
             payload["stream"] = False  # Disable streaming for faster response
             # payload["top_p"] = 0.9  # Can add for more focused responses
         
-        headers = config.get_api_headers()
-        
-        # Set optimized timeouts (shorter for faster responses)
-        timeout = (5, 20) if config.API_PROVIDER == "openai" else (8, 30)
-        
         last_error = ""
         for attempt in range(3):  # Reduced retry attempts for speed
             try:
                 response = self.session.post(
-                    config.CURRENT_API_URL,
-                    json=payload,
-                    headers=headers,
-                    timeout=timeout
+                    self._api_url,
+                    data=orjson.dumps(payload),
+                    timeout=self._timeout
                 )
                 
                 if response.status_code == 200:
-                    result = response.json()["choices"][0]["message"]["content"]
-                    
-                    # Cache the successful response
-                    self.cache.set(messages, config.CURRENT_MODEL, opt_temperature, opt_max_tokens, result)
-                    
-                    return result
+                    return orjson.loads(response.content)["choices"][0]["message"]["content"]
                 
                 # Handle non-retryable errors
                 if response.status_code not in (429, 500, 502, 503, 504):
@@ -199,6 +343,67 @@ class AIAPIClient:
         
         raise Exception(f"API call failed after retries - {last_error}")
     
+    def stream_ai_api(self, messages: List[Dict[str, str]], temperature: float = None,
+                      max_tokens: int = None, cache_ttl_minutes: Optional[int] = None,
+                      use_cache: bool = True) -> Iterator[str]:
+        """
+        Stream an AI response, yielding text chunks as they arrive.
+        
+        A cached response is yielded in one piece. Otherwise the chunks are
+        joined and cached once the stream completes.
+        
+        Args:
+            messages: List of message dictionaries for the conversation
+            temperature: Override default temperature (optional)
+            max_tokens: Override default max tokens (optional)
+            cache_ttl_minutes: How long to cache the response (optional)
+            use_cache: Read the cache before calling (the response is cached either way)
+        
+        Yields:
+            Pieces of the AI response content
+        
+        Raises:
+            Exception: If the API rejects the request
+        """
+        opt_temperature, opt_max_tokens = self._optimize_parameters_for_speed(temperature, max_tokens)
+        
+        if use_cache:
+            cached_response = self.cache.get(messages, config.CURRENT_MODEL, opt_temperature, opt_max_tokens)
+            if cached_response:
+                yield cached_response
+                return
+        
+        payload = {
+            "model": config.CURRENT_MODEL,
+            "messages": messages,
+            "temperature": opt_temperature,
+            "max_tokens": opt_max_tokens,
+            "stream": True
+        }
+        chunks = []
+        with self.session.post(self._api_url, data=orjson.dumps(payload),
+                               timeout=self._timeout, stream=True) as response:
+            if response.status_code != 200:
+                raise Exception(f"API call failed: {response.status_code} - {response.text}")
+            
+            # Server-sent events: one "data: {json}" line per chunk, then "data: [DONE]"
+            for line in response.iter_lines():
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[len(b"data:"):].strip()
+                if data == b"[DONE]":
+                    break
+                
+                choices = orjson.loads(data).get("choices") or [{}]
+                content = choices[0].get("delta", {}).get("content")
+                if content:
+                    chunks.append(content)
+                    yield content
+        
+        if chunks:
+            self.cache.set(messages, config.CURRENT_MODEL, opt_temperature, opt_max_tokens, "".join(chunks),
+                           cache_ttl_minutes)
+    
     def get_provider_info(self) -> Dict[str, str]:
         """Get current API provider information."""
         return {
@@ -213,11 +418,17 @@ class AIAPIClient:
 ai_client = AIAPIClient()
 
 # Backward compatibility function
-def call_deepseek(messages: List[Dict[str, str]], temperature: float = None, max_tokens: int = None) -> str:
+def call_deepseek(messages: List[Dict[str, str]], temperature: float = None, max_tokens: int = None,
+                  cache_ttl_minutes: Optional[int] = None, use_cache: bool = True,
+                  stream: bool = False) -> Union[str, Iterator[str]]:
     """
     Backward compatibility function that now supports multiple providers.
+    
+    With stream=True an iterator of text chunks is returned instead of the full text.
     """
-    return ai_client.call_ai_api(messages, temperature, max_tokens)
+    if stream:
+        return ai_client.stream_ai_api(messages, temperature, max_tokens, cache_ttl_minutes, use_cache)
+    return ai_client.call_ai_api(messages, temperature, max_tokens, cache_ttl_minutes, use_cache)
 
 
 # Cleanup function for maintenance
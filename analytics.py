@@ -4,22 +4,99 @@ Provides user progress visualization and learning analytics.
 """
 
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from database import db
 from auth import get_current_user_id, AuthManager
 
 
+LESSON_PROGRESS_SQL = """
+    SELECT l.lesson_no, l.title, 
+           COALESCE(up.is_completed, 0) as completed,
+           COALESCE(up.time_spent, 0) as time_spent,
+           up.completion_date
+    FROM lessons l
+    LEFT JOIN user_progress up ON l.lesson_no = up.lesson_no AND up.user_id = ?
+    ORDER BY l.lesson_no_int
+"""
+
+LESSON_COMPLETION_SQL = """
+    SELECT COUNT(*) as total_lessons,
+           COALESCE(SUM(up.is_completed), 0) as completed_count,
+           COALESCE(SUM(up.is_completed) * 100.0 / NULLIF(COUNT(*), 0), 0) as completion_rate
+    FROM lessons l
+    LEFT JOIN user_progress up ON l.lesson_no = up.lesson_no AND up.user_id = ?
+"""
+
+RECENT_QUIZ_ATTEMPTS_SQL = """
+    SELECT qa.lesson_no, l.title, qa.score, qa.total_questions, 
+           qa.score * 100.0 / qa.total_questions as score_percentage,
+           qa.created_at, qa.attempt_number
+    FROM quiz_attempts qa
+    JOIN lessons l ON qa.lesson_no = l.lesson_no
+    WHERE qa.user_id = ?
+    ORDER BY qa.created_at DESC
+    LIMIT 10
+"""
+
+# One point per day keeps the chart payload bounded however many attempts pile up
+DAILY_QUIZ_SCORES_SQL = """
+    SELECT DATE(created_at) as date,
+           AVG(CAST(score AS FLOAT) / total_questions * 100) as score_percentage,
+           COUNT(*) as attempts
+    FROM quiz_attempts
+    WHERE user_id = ?
+    GROUP BY DATE(created_at)
+    ORDER BY date
+"""
+
+# Filtering on DATE(created_at) lets idx_users_created_date serve both the range and the grouping
+DAILY_REGISTRATIONS_SQL = """
+    SELECT DATE(created_at) as date, COUNT(*) as registrations
+    FROM users
+    WHERE DATE(created_at) >= ?
+    GROUP BY DATE(created_at)
+    ORDER BY date
+"""
+
+TOP_PERFORMERS_SQL = """
+    SELECT u.username, u.full_name,
+           COUNT(DISTINCT up.lesson_no) as completed_lessons,
+           AVG(CAST(qa.score AS FLOAT) / qa.total_questions * 100) as avg_quiz_score
+    FROM users u
+    LEFT JOIN user_progress up ON u.id = up.user_id AND up.is_completed = 1
+    LEFT JOIN quiz_attempts qa ON u.id = qa.user_id
+    WHERE u.role = 'student'
+    GROUP BY u.id, u.username, u.full_name
+    HAVING completed_lessons > 0
+    ORDER BY completed_lessons DESC, avg_quiz_score DESC
+    LIMIT 10
+"""
+
+
+def _utc_cutoff(days: int) -> str:
+    """Timestamp `days` ago in the format SQLite's CURRENT_TIMESTAMP writes."""
+    return (datetime.now(timezone.utc) - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+
+
 def show_analytics_page():
     """Display the analytics dashboard for the current user."""
+    # Imported here so app startup doesn't pay for pandas/plotly until analytics is opened
+    import pandas as pd
+    import plotly.express as px
+    
     st.title("📊 Learning Analytics")
     
     user_id = 1  # Fixed user ID for single-user mode
     
-    # Get user analytics data
-    analytics_data = db.get_user_analytics(user_id)
+    # Get all dashboard data over one connection
+    with db.get_connection() as conn:
+        analytics_data = db.get_user_analytics(user_id)
+        progress_df = pd.read_sql_query(LESSON_PROGRESS_SQL, conn, params=(user_id,))
+        completion = conn.execute(LESSON_COMPLETION_SQL, (user_id,)).fetchone()
+        quiz_df = pd.read_sql_query(RECENT_QUIZ_ATTEMPTS_SQL, conn, params=(user_id,),
+                                    parse_dates=['created_at'])
+        daily_scores_df = pd.read_sql_query(DAILY_QUIZ_SCORES_SQL, conn, params=(user_id,),
+                                            parse_dates=['date'])
     
     # Overview metrics
     st.subheader("📈 Overview")
@@ -59,78 +136,51 @@ def show_analytics_page():
     # Progress visualization
     st.subheader("📚 Lesson Progress")
     
-    with db.get_connection() as conn:
-        # Get detailed progress data
-        lesson_progress = conn.execute("""
-            SELECT l.lesson_no, l.title, 
-                   COALESCE(up.is_completed, 0) as completed,
-                   COALESCE(up.time_spent, 0) as time_spent,
-                   up.completion_date
-            FROM lessons l
-            LEFT JOIN user_progress up ON l.lesson_no = up.lesson_no AND up.user_id = ?
-            ORDER BY CAST(l.lesson_no AS INTEGER)
-        """, (user_id,)).fetchall()
+    if not progress_df.empty:
+        # Progress bar chart
+        fig = px.bar(
+            progress_df, 
+            x='lesson_no', 
+            y='time_spent', 
+            color='completed',
+            title="Time Spent per Lesson",
+            labels={'time_spent': 'Time (seconds)', 'lesson_no': 'Lesson'},
+            color_discrete_map={0: '#ff6b6b', 1: '#51cf66'}
+        )
+        st.plotly_chart(fig, use_container_width=True)
         
-        if lesson_progress:
-            progress_df = pd.DataFrame([dict(row) for row in lesson_progress])
-            
-            # Progress bar chart
-            fig = px.bar(
-                progress_df, 
-                x='lesson_no', 
-                y='time_spent', 
-                color='completed',
-                title="Time Spent per Lesson",
-                labels={'time_spent': 'Time (seconds)', 'lesson_no': 'Lesson'},
-                color_discrete_map={0: '#ff6b6b', 1: '#51cf66'}
-            )
-            st.plotly_chart(fig, use_container_width=True)
-            
-            # Completion status
-            completed_count = progress_df['completed'].sum()
-            total_lessons = len(progress_df)
-            completion_rate = (completed_count / total_lessons) * 100 if total_lessons > 0 else 0
-            
-            st.progress(completion_rate / 100)
-            st.write(f"Overall Completion: {completed_count}/{total_lessons} lessons ({completion_rate:.1f}%)")
+        # Completion status
+        completed_count, total_lessons = completion['completed_count'], completion['total_lessons']
+        completion_rate = completion['completion_rate']
+        
+        st.progress(completion_rate / 100)
+        st.write(f"Overall Completion: {completed_count}/{total_lessons} lessons ({completion_rate:.1f}%)")
     
     # Quiz performance
     st.subheader("🧪 Quiz Performance")
     
-    with db.get_connection() as conn:
-        quiz_attempts = conn.execute("""
-            SELECT qa.lesson_no, l.title, qa.score, qa.total_questions, 
-                   qa.created_at, qa.attempt_number
-            FROM quiz_attempts qa
-            JOIN lessons l ON qa.lesson_no = l.lesson_no
-            WHERE qa.user_id = ?
-            ORDER BY qa.created_at DESC
-        """, (user_id,)).fetchall()
+    if not quiz_df.empty:
+        # Quiz scores over time
+        fig = px.line(
+            daily_scores_df, 
+            x='date', 
+            y='score_percentage',
+            title="Average Quiz Score per Day",
+            labels={'score_percentage': 'Score (%)', 'date': 'Date'},
+            hover_data=['attempts'],
+            render_mode='webgl'
+        )
+        fig.add_hline(y=80, line_dash="dash", line_color="green", 
+                     annotation_text="Pass Threshold (80%)")
+        st.plotly_chart(fig, use_container_width=True)
         
-        if quiz_attempts:
-            quiz_df = pd.DataFrame([dict(row) for row in quiz_attempts])
-            quiz_df['score_percentage'] = (quiz_df['score'] / quiz_df['total_questions']) * 100
-            quiz_df['created_at'] = pd.to_datetime(quiz_df['created_at'])
-            
-            # Quiz scores over time
-            fig = px.line(
-                quiz_df, 
-                x='created_at', 
-                y='score_percentage',
-                title="Quiz Scores Over Time",
-                labels={'score_percentage': 'Score (%)', 'created_at': 'Date'}
-            )
-            fig.add_hline(y=80, line_dash="dash", line_color="green", 
-                         annotation_text="Pass Threshold (80%)")
-            st.plotly_chart(fig, use_container_width=True)
-            
-            # Recent quiz attempts
-            st.subheader("Recent Quiz Attempts")
-            recent_quizzes = quiz_df.head(10)[['title', 'score', 'total_questions', 'score_percentage', 'created_at']]
-            recent_quizzes['created_at'] = recent_quizzes['created_at'].dt.strftime('%Y-%m-%d %H:%M')
-            st.dataframe(recent_quizzes, use_container_width=True)
-        else:
-            st.info("No quiz attempts yet. Complete some lesson quizzes to see your performance!")
+        # Recent quiz attempts
+        st.subheader("Recent Quiz Attempts")
+        recent_quizzes = quiz_df[['title', 'score', 'total_questions', 'score_percentage', 'created_at']]
+        recent_quizzes['created_at'] = recent_quizzes['created_at'].dt.strftime('%Y-%m-%d %H:%M')
+        st.dataframe(recent_quizzes, use_container_width=True)
+    else:
+        st.info("No quiz attempts yet. Complete some lesson quizzes to see your performance!")
     
     # Final test results
     final_test_data = analytics_data.get('final_test')
@@ -186,6 +236,9 @@ def show_analytics_page():
 
 def show_admin_analytics():
     """Display admin analytics dashboard."""
+    import pandas as pd
+    import plotly.express as px
+    
     user = AuthManager.get_current_user()
     if not user or user['role'] != 'admin':
         st.error("Admin access required.")
@@ -197,78 +250,55 @@ def show_admin_analytics():
     st.subheader("📊 System Overview")
     
     with db.get_connection() as conn:
-        # User stats
-        user_stats = conn.execute("""
-            SELECT 
-                COUNT(*) as total_users,
-                SUM(CASE WHEN is_active = 1 THEN 1 ELSE 0 END) as active_users,
-                SUM(CASE WHEN last_login > datetime('now', '-7 days') THEN 1 ELSE 0 END) as recent_users
-            FROM users
-        """).fetchone()
-        
-        # Lesson stats
-        lesson_stats = conn.execute("""
-            SELECT COUNT(*) as total_lessons FROM lessons
-        """).fetchone()
+        # User, lesson and quiz stats in one statement
+        stats = conn.execute("""
+            WITH u AS (
+                SELECT 
+                    COUNT(*) as total_users,
+                    COUNT(*) FILTER (WHERE is_active = 1) as active_users,
+                    COUNT(*) FILTER (WHERE last_login > :recent_cutoff) as recent_users
+                FROM users
+            ),
+            l AS (
+                SELECT COUNT(*) as total_lessons FROM lessons
+            ),
+            q AS (
+                SELECT 
+                    COUNT(*) as total_attempts,
+                    AVG(CAST(score AS FLOAT) / total_questions * 100) as avg_score
+                FROM quiz_attempts
+            )
+            SELECT * FROM u, l, q
+        """, {'recent_cutoff': _utc_cutoff(7)}).fetchone()
         
-        # Quiz stats
-        quiz_stats = conn.execute("""
-            SELECT 
-                COUNT(*) as total_attempts,
-                AVG(CAST(score AS FLOAT) / total_questions * 100) as avg_score
-            FROM quiz_attempts
-        """).fetchone()
+        activity_df = pd.read_sql_query(DAILY_REGISTRATIONS_SQL, conn, params=(_utc_cutoff(30)[:10],),
+                                        parse_dates=['date'])
+        top_df = pd.read_sql_query(TOP_PERFORMERS_SQL, conn)
     
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        st.metric("Total Users", user_stats['total_users'])
+        st.metric("Total Users", stats['total_users'])
     with col2:
-        st.metric("Active Users", user_stats['active_users'])
+        st.metric("Active Users", stats['active_users'])
     with col3:
-        st.metric("Recent Users (7d)", user_stats['recent_users'])
+        st.metric("Recent Users (7d)", stats['recent_users'])
     with col4:
-        st.metric("Total Lessons", lesson_stats['total_lessons'])
+        st.metric("Total Lessons", stats['total_lessons'])
     
     # User activity over time
     st.subheader("📈 User Activity")
     
-    with db.get_connection() as conn:
-        activity_data = conn.execute("""
-            SELECT DATE(created_at) as date, COUNT(*) as registrations
-            FROM users
-            WHERE created_at >= datetime('now', '-30 days')
-            GROUP BY DATE(created_at)
-            ORDER BY date
-        """).fetchall()
-        
-        if activity_data:
-            activity_df = pd.DataFrame([dict(row) for row in activity_data])
-            fig = px.line(activity_df, x='date', y='registrations', 
-                         title="Daily User Registrations (Last 30 Days)")
-            st.plotly_chart(fig, use_container_width=True)
+    if not activity_df.empty:
+        fig = px.line(activity_df, x='date', y='registrations', 
+                     title="Daily User Registrations (Last 30 Days)", render_mode='webgl')
+        st.plotly_chart(fig, use_container_width=True)
     
     # Top performing users
     st.subheader("🏆 Top Performers")
     
-    with db.get_connection() as conn:
-        top_users = conn.execute("""
-            SELECT u.username, u.full_name,
-                   COUNT(DISTINCT up.lesson_no) as completed_lessons,
-                   AVG(CAST(qa.score AS FLOAT) / qa.total_questions * 100) as avg_quiz_score
-            FROM users u
-            LEFT JOIN user_progress up ON u.id = up.user_id AND up.is_completed = 1
-            LEFT JOIN quiz_attempts qa ON u.id = qa.user_id
-            WHERE u.role = 'student'
-            GROUP BY u.id, u.username, u.full_name
-            HAVING completed_lessons > 0
-            ORDER BY completed_lessons DESC, avg_quiz_score DESC
-            LIMIT 10
-        """).fetchall()
-        
-        if top_users:
-            top_df = pd.DataFrame([dict(row) for row in top_users])
-            st.dataframe(top_df, use_container_width=True)
+    if not top_df.empty:
+        st.dataframe(top_df, use_container_width=True)
 
 
 if __name__ == "__main__":
@@ -1,19 +1,12 @@
 import streamlit as st
-import pandas as pd
 import re
-<<<<<<< HEAD
-from deepseek_api import call_openai
-from progress import load_progress, save_progress
-from dynamic_quiz_generator import generate_dynamic_quiz
-from completed_tracker import load_completed, mark_completed, unmark_completed
-from vector_utils import build_lesson_vectors, search_lessons
-
-# Markdown cleaning function
-def clean_markdown(md_text: str) -> str:
-=======
+import csv
 import json
 import html
+import itertools
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
 from config import config
 from ai_api import call_deepseek, ai_client
@@ -28,7 +21,28 @@ TARGETS = {
     "In-depth":        {"words": 1200, "max_tokens": 2000},
 }
 
+# Sentence-like runs between separators, used to pick deep-dive points
+_POINT_RE = re.compile(r'[^。.\n;]+')
+
+def extract_points(content: str) -> list:
+    """First eight sentence-like runs longer than 30 characters."""
+    # Scan lazily and stop at the eighth usable sentence
+    return list(itertools.islice(
+        (p for p in (m.group().strip() for m in _POINT_RE.finditer(content)) if len(p) > 30),
+        8
+    ))
+
 # ---------- Input Validation and Security Functions ----------
+_DANGEROUS_RE = re.compile(
+    '|'.join([
+        r'<script.*?</script>',
+        r'javascript:',
+        r'on\w+\s*=',
+        r'data:text/html'
+    ]),
+    re.IGNORECASE | re.DOTALL
+)
+
 def sanitize_input(text: str, max_length: int = 500) -> str:
     """Sanitize user input to prevent XSS and limit length."""
     if not text:
@@ -41,15 +55,7 @@ def sanitize_input(text: str, max_length: int = 500) -> str:
     text = html.escape(text)
     
     # Remove potential script tags and dangerous patterns
-    dangerous_patterns = [
-        r'<script.*?</script>',
-        r'javascript:',
-        r'on\w+\s*=',
-        r'data:text/html'
-    ]
-    
-    for pattern in dangerous_patterns:
-        text = re.sub(pattern, '', text, flags=re.IGNORECASE)
+    text = _DANGEROUS_RE.sub('', text)
     
     return text.strip()
 
@@ -66,73 +72,67 @@ def validate_lesson_content(content: str) -> str:
     return content
 
 # ---------- Markdown Cleaning (for speech) ----------
+# Headers, bold, links, formatting characters and HTML tags in one pass
+_MD_RE = re.compile(r'(#+ ?)|(\*\*(.*?)\*\*)|(\[(.*?)\]\(.*?\))|([`*_>])|(<[^>]*>)')
+
+def _md_repl(match: re.Match) -> str:
+    # Bold and link text is kept, cleaned the same way; everything else is dropped
+    inner = match.group(3) or match.group(5)
+    return _MD_RE.sub(_md_repl, inner) if inner else ''
+
+# Every _MD_RE alternative starts with one of these characters
+_MD_SENTINELS = "#*[`_><"
+
 def clean_markdown(md_text: str) -> str:
     if not md_text:
         return ""
     
->>>>>>> c865a80 (更新说明，例如：fix bug / 添加功能)
-    text = re.sub(r'#* ?', '', md_text)
-    text = re.sub(r'\*\*(.*?)\*\*', r'\1', text)
-    text = re.sub(r'\[(.*?)\]\(.*?\)', r'\1', text)
-    text = re.sub(r'[`*_>]', '', text)
-<<<<<<< HEAD
-    return text
-
-# Load lesson data
-@st.cache_data
-def load_lessons():
-    df = pd.read_csv("lessons.csv", encoding="ISO-8859-1")
-    return df.to_dict(orient="records")
-
-# Load explanation template
-=======
-    
-    # Additional security: remove any remaining HTML tags
-    text = re.sub(r'<[^>]*>', '', text)
+    # Plain text (no sentinel anywhere) skips the regex engine; `in` is a memchr-style scan
+    if not any(ch in md_text for ch in _MD_SENTINELS):
+        return md_text
     
-    return text
+    return _MD_RE.sub(_md_repl, md_text)
 
 # ---------- Load Data from Database ----------
-@st.cache_data
-def load_lessons():
+def _with_points(lesson: dict) -> dict:
+    # Deep-dive points are split once here rather than on every rerun
+    lesson["_points"] = extract_points(str(lesson["Content"]))
+    return lesson
+
+# Lessons and the template never change at runtime, so one shared (read-only)
+# copy is handed to every session instead of a per-call deep copy
+@st.cache_resource(ttl=3600)
+def load_lessons() -> tuple:
     """Load lessons from database, fallback to CSV if needed."""
     try:
         with db.get_connection() as conn:
             lessons = conn.execute("""
                 SELECT lesson_no as 'No', title as 'Title', content as 'Content'
-                FROM lessons ORDER BY CAST(lesson_no AS INTEGER)
+                FROM lessons ORDER BY lesson_no_int
             """).fetchall()
             
             if lessons:
-                return [dict(lesson) for lesson in lessons]
+                return tuple(_with_points(dict(lesson)) for lesson in lessons)
     except Exception:
         pass
     
     # Fallback to CSV
     try:
-        df = pd.read_csv("lessons.csv", encoding="ISO-8859-1")
-        return df.to_dict(orient="records")
+        with open("lessons.csv", encoding="ISO-8859-1", newline="") as f:
+            lessons = list(csv.DictReader(f))
+        for lesson in lessons:
+            # Match the DB's lesson_no form ("001" is stored as "1")
+            if lesson["No"].isdigit():
+                lesson["No"] = str(int(lesson["No"]))
+        return tuple(_with_points(lesson) for lesson in lessons)
     except Exception:
-        return []
+        return ()
 
->>>>>>> c865a80 (更新说明，例如：fix bug / 添加功能)
-@st.cache_data
+@st.cache_resource(ttl=3600)
 def load_template():
     with open("prompt_template.txt", "r", encoding="ISO-8859-1") as f:
         return f.read()
 
-<<<<<<< HEAD
-lessons = load_lessons()
-lesson_vectors = build_lesson_vectors(lessons)
-template = load_template()
-
-if "current_index" not in st.session_state:
-    st.session_state.current_index = load_progress()
-
-# Sidebar navigation
-st.sidebar.title("📚 Course Outline")
-completed_list = load_completed()
-=======
 def get_user_progress(user_id: int):
     """Get user progress from database."""
     return db.get_user_progress(user_id)
@@ -141,9 +141,9 @@ def get_completed_lessons(user_id: int):
     """Get completed lessons for user."""
     return db.get_completed_lessons(user_id)
 
-# ---------- Cached Explanation ----------
-@st.cache_data(show_spinner=False)
-def explain_cached(lesson_no: str, title: str, content: str, template_text: str, detail_label: str) -> str:
+# ---------- Explanation Prompt ----------
+def explain_messages(lesson_no: str, title: str, content: str, template_text: str, detail_label: str) -> list:
+    """Build the explanation request; the streamed response is kept in st.session_state."""
     tgt = TARGETS[detail_label]
     system_msg = (
         f"You are a professional AI teacher. Use ONLY the provided lesson content. "
@@ -155,11 +155,11 @@ def explain_cached(lesson_no: str, title: str, content: str, template_text: str,
         {"role": "system", "content": system_msg},
         {"role": "user", "content": prompt}
     ]
-    return call_deepseek(messages)
+    return messages
 
 # ---------- Point-by-Point Deep Expansion (lazy loading + caching) ----------
-@st.cache_data(show_spinner=False)
-def expand_point_cached(lesson_no: str, title: str, content: str, point_text: str, detail_label: str) -> str:
+def expand_point_messages(lesson_no: str, title: str, content: str, point_text: str, detail_label: str) -> list:
+    """Build the point expansion request; the response is streamed on click (ai_api caches it only when response caching is enabled)."""
     tgt = TARGETS[detail_label]
     target_words = max(400, int(tgt["words"] * 0.6)) if detail_label != "Overview (fast)" else 350
     system_msg = (
@@ -180,7 +180,13 @@ Focus point to expand:
         {"role": "system", "content": system_msg},
         {"role": "user", "content": user}
     ]
-    return call_deepseek(messages)
+    return messages
+
+# ---------- Background Work ----------
+@st.cache_resource
+def background_executor() -> ThreadPoolExecutor:
+    """Shared worker threads for LLM calls that don't render anything themselves."""
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="lesson-prefetch")
 
 # ---------- Application Setup ----------
 def init_app():
@@ -218,26 +224,31 @@ if "current_index" not in st.session_state:
 # ---------- Sidebar: Course Outline & Detail Level ----------
 st.sidebar.title("📚 Course Outline")
 
-# Get completed lessons from database
-completed_list = get_completed_lessons(USER_ID)
-
->>>>>>> c865a80 (更新说明，例如：fix bug / 添加功能)
-for i, l in enumerate(lessons):
-    label = f"✅ {i+1}. {l['Title']}" if l['No'] in completed_list else f"{i+1}. {l['Title']}"
-    if st.sidebar.button(label, key=f"jump_{i}"):
-        st.session_state.current_index = i
-        st.session_state["final_test_mode"] = False
-<<<<<<< HEAD
-        save_progress(i)
-
-# Final Test button
-if st.sidebar.button("🏁 Final Test", key="final_test"):
-    st.session_state["final_test_mode"] = True
-
-# Final test logic
-=======
-        # Save progress to database
-        db.update_user_progress(USER_ID, l['No'], current_index=i)
+# Completed lessons are loaded once per session and kept in sync by the mark/unmark buttons
+if "completed_set" not in st.session_state:
+    st.session_state["completed_set"] = set(get_completed_lessons(USER_ID))
+completed_list = st.session_state["completed_set"]
+
+lesson_labels = [
+    f"✅ {i+1}. {l['Title']}" if l['No'] in completed_list else f"{i+1}. {l['Title']}"
+    for i, l in enumerate(lessons)
+]
+
+def jump_to_lesson():
+    """Sidebar callback: open the picked lesson and save it as the current one."""
+    i = st.session_state["lesson_nav"]
+    st.session_state.current_index = i
+    st.session_state["final_test_mode"] = False
+    # Save progress to database
+    db.update_user_progress(USER_ID, lessons[i]['No'], current_index=i)
+
+# A single radio instead of one button per lesson; synced with the
+# current lesson so navigation from the main page is reflected here
+st.session_state["lesson_nav"] = st.session_state.current_index
+st.sidebar.radio(
+    "Lessons", range(len(lessons)), format_func=lesson_labels.__getitem__,
+    key="lesson_nav", on_change=jump_to_lesson, label_visibility="collapsed"
+)
 
 # Detail level selection (default: Standard)
 detail = st.sidebar.selectbox("Detail level", ["Overview (fast)", "Standard", "In-depth"], index=1)
@@ -271,53 +282,49 @@ if st.session_state.get("analytics_mode", False):
     st.stop()
 
 # ---------- Final Test Logic ----------
->>>>>>> c865a80 (更新说明，例如：fix bug / 添加功能)
 if st.session_state.get("final_test_mode", False):
     st.title("🏁 Final Test: Comprehensive Assessment")
-    all_content = "\n\n".join([f"Lesson {l['No']}: {l['Content']}" for l in lessons])
-
-    with st.spinner("Generating 50 questions..."):
-        quizzes = generate_dynamic_quiz(
-            lesson_title="Final Assessment",
-            lesson_content=all_content,
-            num_questions=50
-        )
-
-    score = 0
-    submitted = st.button("✅ Submit Final Test")
-
-    for i, item in enumerate(quizzes):
-        st.markdown(f"**{i+1}. {item['question']}**")
-        choice = st.radio("Select:", item["options"], key=f"final_q{i}")
-        user_letter = choice[0] if choice else None
-        correct_letter = item["answer"]
 
-        if submitted:
-            if user_letter == correct_letter:
-                st.success("✅ Correct")
-                score += 1
-            else:
-                st.error(f"❌ Incorrect. Correct answer: {correct_letter}")
-            st.caption(f"📘 Explanation: {item['explanation']}")
+    # Generated once per session; answering questions reruns the page without rebuilding it
+    if "final_quiz" not in st.session_state:
+        all_content = "\n\n".join(f"Lesson {l['No']}: {l['Content']}" for l in lessons)
+        with st.spinner("Generating 50 questions..."):
+            st.session_state["final_quiz"] = generate_dynamic_quiz(
+                lesson_title="Final Assessment",
+                lesson_content=all_content,
+                num_questions=50
+            )
+    quizzes = st.session_state["final_quiz"]
+
+    user_letters = []
+    with st.form(key="final_test_form"):
+        submitted = st.form_submit_button("✅ Submit Final Test")
+
+        for i, item in enumerate(quizzes):
+            st.markdown(f"**{i+1}. {item['question']}**")
+            choice = st.radio("Select:", item["options"], key=f"final_q{i}")
+            user_letter = choice[0] if choice else None
+            correct_letter = item["answer"]
+            user_letters.append(user_letter)
+
+            if submitted:
+                if user_letter == correct_letter:
+                    st.success("✅ Correct")
+                else:
+                    st.error(f"❌ Incorrect. Correct answer: {correct_letter}")
+                st.caption(f"📘 Explanation: {item['explanation']}")
 
     if submitted:
+        score = sum(u == q["answer"] for u, q in zip(user_letters, quizzes))
         st.markdown(f"### 🧾 Final Score: {score} / {len(quizzes)}")
         if score >= 40:
             st.success("🎉 Excellent! You passed the course!")
         else:
-<<<<<<< HEAD
-            st.warning("📘 Review the lessons and try again.")
-
-    st.stop()
-
-# Current lesson
-=======
             st.warning("📘 Please review the lessons and try again.")
 
     st.stop()
 
 # ---------- Current Lesson ----------
->>>>>>> c865a80 (更新说明，例如：fix bug / 添加功能)
 idx = st.session_state.current_index
 lesson = lessons[idx]
 st.title(f"Lesson {lesson['No']}: {lesson['Title']}")
@@ -326,135 +333,107 @@ completed = lesson["No"] in completed_list
 col1, col2 = st.columns(2)
 if completed:
     if col1.button("✅ Completed (Click to Unmark)"):
-<<<<<<< HEAD
-        unmark_completed(lesson["No"])
+        db.update_user_progress(USER_ID, lesson["No"], current_index=idx, is_completed=False, flush=True)
+        st.session_state["completed_set"].discard(lesson["No"])
         st.rerun()
 else:
     if col1.button("📘 Mark as Completed"):
-        mark_completed(lesson["No"])
-        st.rerun()
-
-# GPT Explanation
-if f"explanation_{idx}" not in st.session_state:
-    prompt = template.format(
-        id=lesson["No"],
-        title=lesson["Title"],
-        content=lesson["Content"]
-    )
-    messages = [
-        {"role": "system", "content": "You are a professional and structured AI teacher."},
-        {"role": "user", "content": prompt}
-    ]
-    with st.spinner("Generating explanation…"):
-        output = call_openai(messages)
-        st.session_state[f"explanation_{idx}"] = output
-
-st.markdown(st.session_state[f"explanation_{idx}"])
-
-# 🔈 Speech buttons
-clean_text = clean_markdown(st.session_state[f"explanation_{idx}"])
-=======
-        db.update_user_progress(USER_ID, lesson["No"], is_completed=False)
-        st.rerun()
-else:
-    if col1.button("📘 Mark as Completed"):
-        db.update_user_progress(USER_ID, lesson["No"], is_completed=True)
+        db.update_user_progress(USER_ID, lesson["No"], current_index=idx, is_completed=True, flush=True)
+        st.session_state["completed_set"].add(lesson["No"])
         st.rerun()
 
 content_raw = validate_lesson_content(lesson["Content"])
 
 # ---------- Generate Explanation (adaptive depth + caching) ----------
-with st.spinner("Generating explanation…"):
+# A new lesson's quiz is generated in the background while the explanation streams
+quiz_futures = st.session_state.setdefault("quiz_futures", {})
+if idx not in st.session_state.setdefault("quiz_cache", OrderedDict()) and idx not in quiz_futures:
+    quiz_futures[idx] = background_executor().submit(
+        generate_dynamic_quiz, lesson_title=lesson["Title"], lesson_content=lesson["Content"]
+    )
+
+# Tokens render as they arrive on the first render; every later rerun (questions, quiz
+# buttons, ...) re-renders the kept text instead of requesting the explanation again
+EXPLANATION_CACHE_SIZE = 5
+explanations = st.session_state.setdefault("explanations", OrderedDict())
+explanation_key = (lesson["No"], detail)
+output = explanations.get(explanation_key)
+if output is not None:
+    explanations.move_to_end(explanation_key)
+    st.markdown(output)
+else:
     try:
-        output = explain_cached(str(lesson["No"]), lesson["Title"], lesson["Content"], template, detail)
+        messages = explain_messages(str(lesson["No"]), lesson["Title"], lesson["Content"], template, detail)
+        output = st.write_stream(ai_client.stream_ai_api(
+            messages, cache_ttl_minutes=config.LESSON_CACHE_DURATION_MINUTES
+        ))
+        if output:
+            explanations[explanation_key] = output
+            while len(explanations) > EXPLANATION_CACHE_SIZE:
+                explanations.popitem(last=False)
     except Exception as e:
         st.error("❌ Failed to generate explanation")
         st.exception(e)
         output = ""
 
-st.markdown(output if output else "_No content returned._")
+if not output:
+    st.markdown("_No content returned._")
 
 # ---------- Point-by-Point Expansion (auto-extract 3-8 points from content) ----------
 st.markdown("---")
 st.subheader("🔎 Deep dive by point (optional)")
-raw_points = [p.strip() for p in re.split(r'[。\.\n;]+', lesson["Content"]) if len(p.strip()) > 30]
-points = raw_points[:8] if len(raw_points) > 8 else raw_points
+points = lesson["_points"]
 
 if not points:
     st.caption("No extractable points from content.")
 else:
     for i, p in enumerate(points):
         if st.button(f"Explain point {i+1}", key=f"pt_{idx}_{i}"):
-            with st.spinner("Expanding…"):
-                try:
-                    exp = expand_point_cached(str(lesson["No"]), lesson["Title"], lesson["Content"], p, detail)
-                except Exception as e:
-                    st.error("❌ Failed to expand point")
-                    st.exception(e)
-                else:
-                    st.markdown(exp)
+            try:
+                messages = expand_point_messages(str(lesson["No"]), lesson["Title"], lesson["Content"], p, detail)
+                st.write_stream(call_deepseek(
+                    messages, cache_ttl_minutes=config.LESSON_CACHE_DURATION_MINUTES, stream=True
+                ))
+            except Exception as e:
+                st.error("❌ Failed to expand point")
+                st.exception(e)
 
 # ---------- Text-to-Speech Controls ----------
-clean_text = clean_markdown(output)
->>>>>>> c865a80 (更新说明，例如：fix bug / 添加功能)
-escaped_text = clean_text.replace('"', '\\"').replace("\n", " ")
-speech_html = f"""
+# Static player shell; only the text variable in front of it changes per explanation
+_SPEECH_CONTROLS_HTML = """
     <script>
     var utterance;
-    function speakText() {{
-        if (speechSynthesis.speaking) {{
+    function speakText() {
+        if (speechSynthesis.speaking) {
             speechSynthesis.cancel();
-        }}
-        utterance = new SpeechSynthesisUtterance("{escaped_text}");
+        }
+        utterance = new SpeechSynthesisUtterance(speechText);
         utterance.lang = "en-US";
         speechSynthesis.speak(utterance);
-    }}
-<<<<<<< HEAD
-
-=======
->>>>>>> c865a80 (更新说明，例如：fix bug / 添加功能)
-    function stopSpeech() {{
-        if (speechSynthesis.speaking) {{
+    }
+    function stopSpeech() {
+        if (speechSynthesis.speaking) {
             speechSynthesis.cancel();
-        }}
-    }}
+        }
+    }
     </script>
     <button onclick="speakText()">🔈 Play Explanation</button>
     <button onclick="stopSpeech()">🛑 Stop</button>
 """
-st.components.v1.html(speech_html, height=80)
 
-<<<<<<< HEAD
-# Question input
-st.subheader("💬 Ask a Question (Optional)")
-question = st.text_input("Enter your question:", key="qa_input")
+def build_speech_html(text: str) -> str:
+    """Render the play/stop speech controls for an explanation."""
+    # json.dumps yields a valid JS string literal; "<" is escaped so the text can't close the tag
+    js_text = json.dumps(clean_markdown(text)).replace("<", "\\u003c")
+    return f"<script>var speechText = {js_text};</script>" + _SPEECH_CONTROLS_HTML
 
-if st.button("Submit Question"):
-    if question.strip() == "":
-        st.warning("Please enter a question.")
-    else:
-        related = search_lessons(question, lessons, lesson_vectors)
-        context = "\n\n".join(l["Content"] for l in related) or lesson["Content"]
-        qa_prompt = f"""Lesson content:
-{context}
+# Reruns for the same lesson and explanation reuse the built widget
+speech_key = ("speech", idx, hash(output))
+if st.session_state.get("speech_key") != speech_key:
+    st.session_state["speech_html"] = build_speech_html(output)
+    st.session_state["speech_key"] = speech_key
+st.components.v1.html(st.session_state["speech_html"], height=80)
 
-Please answer the student's question based on the lesson content above:
-Question: {question}
-"""
-        messages = [
-            {"role": "system", "content": "You are a helpful AI teaching assistant."},
-            {"role": "user", "content": qa_prompt}
-        ]
-        with st.spinner("Thinking..."):
-            answer = call_openai(messages)
-            st.markdown(f"📘 Answer:\n\n{answer}")
-        if related:
-            st.markdown("### 🔍 Related Lessons")
-            for l in related:
-                st.markdown(f"- {l['No']}: {l['Title']}")
-
-# Quiz generation
-=======
 # ---------- Student Q&A (adaptive length based on detail level) ----------
 st.subheader("💬 Ask a Question (Optional)")
 question = st.text_input("Enter your question:", key="qa_input", max_chars=500)
@@ -480,101 +459,105 @@ Question: {sanitized_question}
             {"role": "system", "content": qa_system},
             {"role": "user", "content": qa_prompt}
         ]
-        with st.spinner("Thinking..."):
-            try:
-                answer = call_deepseek(messages)
-                st.markdown(f"📘 Answer:\n\n{answer}")
-                
-                # Save Q&A interaction to database
-                db.save_qa_interaction(USER_ID, lesson["No"], sanitized_question, answer, detail)
-            except Exception as e:
-                st.error("❌ Failed to generate answer")
-                st.exception(e)
+        try:
+            st.markdown("📘 Answer:")
+            answer = st.write_stream(ai_client.stream_ai_api(
+                messages, cache_ttl_minutes=config.LESSON_CACHE_DURATION_MINUTES
+            ))
+            
+            # Save Q&A interaction to database
+            db.save_qa_interaction(USER_ID, lesson["No"], sanitized_question, answer, detail, flush=True)
+        except Exception as e:
+            st.error("❌ Failed to generate answer")
+            st.exception(e)
 
 # ---------- Lesson Quiz ----------
->>>>>>> c865a80 (更新说明，例如：fix bug / 添加功能)
-if f"quiz_{idx}" not in st.session_state:
+# Only the most recent lessons' quizzes stay in the session; older ones come back from the quiz_cache table
+QUIZ_CACHE_SIZE = 5
+quiz_cache = st.session_state.setdefault("quiz_cache", OrderedDict())
+
+# Picks up the quiz started in the background when the lesson opened, if there is one
+quiz_future = st.session_state.get("quiz_futures", {}).pop(idx, None)
+if idx not in quiz_cache:
     with st.spinner("Generating quiz…"):
-        st.session_state[f"quiz_{idx}"] = generate_dynamic_quiz(
-            lesson_title=lesson["Title"],
-            lesson_content=lesson["Content"]
-        )
+        if quiz_future is not None:
+            quiz_cache[idx] = quiz_future.result()
+        else:
+            quiz_cache[idx] = generate_dynamic_quiz(
+                lesson_title=lesson["Title"],
+                lesson_content=lesson["Content"]
+            )
+quiz_cache.move_to_end(idx)
+while len(quiz_cache) > QUIZ_CACHE_SIZE:
+    quiz_cache.popitem(last=False)
 
 if st.button("🔄 Regenerate Quiz"):
     with st.spinner("Regenerating quiz…"):
-        st.session_state[f"quiz_{idx}"] = generate_dynamic_quiz(
+        quiz_cache[idx] = generate_dynamic_quiz(
             lesson_title=lesson["Title"],
-            lesson_content=lesson["Content"]
+            lesson_content=lesson["Content"],
+            regenerate=True
         )
         st.rerun()
 
-quizzes = st.session_state[f"quiz_{idx}"]
+quizzes = quiz_cache[idx]
 st.markdown("### 🧪 Quiz for This Lesson")
 
-score = 0
-<<<<<<< HEAD
-=======
+user_letters = []
 user_answers = {}
 start_time = time.time() if f"quiz_start_time_{idx}" not in st.session_state else st.session_state[f"quiz_start_time_{idx}"]
 if f"quiz_start_time_{idx}" not in st.session_state:
     st.session_state[f"quiz_start_time_{idx}"] = start_time
 
->>>>>>> c865a80 (更新说明，例如：fix bug / 添加功能)
-submitted = st.button("✅ Submit All Quiz Questions")
+# Selections only rerun the script once the form is submitted
+with st.form(key=f"quiz_form_{idx}"):
+    submitted = st.form_submit_button("✅ Submit All Quiz Questions")
 
-for i, item in enumerate(quizzes):
-    st.markdown(f"**{i+1}. {item['question']}**")
-    user_choice = st.radio(
-        label="Please select an answer:",
-        options=item["options"],
-        key=f"quiz_{idx}_{i}"
-    )
-    user_letter = user_choice[0] if user_choice else None
-    correct_letter = item["answer"]
-<<<<<<< HEAD
-=======
-    
-    # Store user answer
-    user_answers[i] = {
-        "question": item["question"],
-        "user_answer": user_letter,
-        "correct_answer": correct_letter,
-        "is_correct": user_letter == correct_letter
-    }
->>>>>>> c865a80 (更新说明，例如：fix bug / 添加功能)
+    for i, item in enumerate(quizzes):
+        st.markdown(f"**{i+1}. {item['question']}**")
+        user_choice = st.radio(
+            label="Please select an answer:",
+            options=item["options"],
+            key=f"quiz_{idx}_{i}"
+        )
+        user_letter = user_choice[0] if user_choice else None
+        correct_letter = item["answer"]
+        user_letters.append(user_letter)
+        
+        # Store user answer
+        user_answers[i] = {
+            "question": item["question"],
+            "user_answer": user_letter,
+            "correct_answer": correct_letter,
+            "is_correct": user_letter == correct_letter
+        }
 
-    if submitted:
-        if user_letter == correct_letter:
-            st.success("✅ Correct")
-            score += 1
-        else:
-            st.error(f"❌ Incorrect. Correct answer: {correct_letter}")
-        st.caption(f"📘 Explanation: {item['explanation']}")
+        if submitted:
+            if user_letter == correct_letter:
+                st.success("✅ Correct")
+            else:
+                st.error(f"❌ Incorrect. Correct answer: {correct_letter}")
+            st.caption(f"📘 Explanation: {item['explanation']}")
+
+score = sum(u == q["answer"] for u, q in zip(user_letters, quizzes))
 
-<<<<<<< HEAD
-# Next lesson
-=======
 # Save quiz results to database when submitted
 if submitted and user_answers:
     time_taken = int(time.time() - start_time)
-    db.save_quiz_attempt(USER_ID, lesson["No"], score, len(quizzes), time_taken, user_answers)
+    # Committed before the score is shown, so a failed save surfaces as an error
+    db.save_quiz_attempt(USER_ID, lesson["No"], score, len(quizzes), time_taken, user_answers, flush=True)
     st.info(f"📊 Quiz completed! Score: {score}/{len(quizzes)} ({score/len(quizzes)*100:.1f}%)")
 
 # ---------- Next Lesson ----------
->>>>>>> c865a80 (更新说明，例如：fix bug / 添加功能)
 if st.button("▶ Next Lesson"):
     if idx + 1 < len(lessons):
         st.session_state.current_index += 1
         st.session_state["final_test_mode"] = False
-<<<<<<< HEAD
-        save_progress(st.session_state.current_index)
-=======
         
         # Save progress to database
         next_lesson = lessons[st.session_state.current_index]
         db.update_user_progress(USER_ID, next_lesson["No"], current_index=st.session_state.current_index)
         
->>>>>>> c865a80 (更新说明，例如：fix bug / 添加功能)
         st.rerun()
     else:
         st.success("🎉 Congratulations! All lessons completed!")
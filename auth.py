@@ -6,37 +6,64 @@ Handles user login, registration, session management, and access control.
 import streamlit as st
 from typing import Optional, Dict, Any
 from database import db
-import re
+import string
+from functools import lru_cache
+
+# Translation table deleting every character allowed in a username
+_USERNAME_DELETE = str.maketrans('', '', string.ascii_letters + string.digits + '_-')
+# Same for the local part and host of an email address (the TLD is checked separately)
+_EMAIL_LOCAL_DELETE = str.maketrans('', '', string.ascii_letters + string.digits + '._%+-')
+_EMAIL_HOST_DELETE = str.maketrans('', '', string.ascii_letters + string.digits + '.-')
+
+
+@lru_cache(maxsize=256)
+def _is_valid_username(username: str) -> bool:
+    """Validate username format."""
+    if not username:
+        return False
+    # 3-50 alphanumeric characters, underscores, and hyphens: nothing may be left after deleting those
+    return 3 <= len(username) <= 50 and not username.translate(_USERNAME_DELETE)
+
+# Deliberately not memoized: an lru_cache would keep plaintext passwords alive
+def _is_valid_password(password: str) -> bool:
+    """Validate password strength."""
+    if not password or len(password) < 6:
+        return False
+    # Require at least one (ASCII) letter and one number, in a single early-exit pass
+    has_letter = has_number = False
+    for c in password:
+        if not c.isascii():
+            continue
+        if c.isalpha():
+            has_letter = True
+        elif c.isdigit():
+            has_number = True
+        if has_letter and has_number:
+            return True
+    return False
+
+@lru_cache(maxsize=256)
+def _is_valid_email(email: str) -> bool:
+    """Validate email format."""
+    if not email:
+        return True  # Email is optional
+    # local@host.tld, checked in linear passes rather than with a backtracking regex
+    local, _, domain = email.rpartition('@')
+    host, _, tld = domain.rpartition('.')
+    if not local or not host or len(tld) < 2:
+        return False
+    if not (tld.isascii() and tld.isalpha()):
+        return False
+    return not local.translate(_EMAIL_LOCAL_DELETE) and not host.translate(_EMAIL_HOST_DELETE)
 
 
 class AuthManager:
     """Manages user authentication and session handling."""
     
-    @staticmethod
-    def is_valid_username(username: str) -> bool:
-        """Validate username format."""
-        if not username or len(username) < 3 or len(username) > 50:
-            return False
-        # Allow alphanumeric characters, underscores, and hyphens
-        return re.match(r'^[a-zA-Z0-9_-]+$', username) is not None
-    
-    @staticmethod
-    def is_valid_password(password: str) -> bool:
-        """Validate password strength."""
-        if not password or len(password) < 6:
-            return False
-        # Require at least one letter and one number
-        has_letter = re.search(r'[a-zA-Z]', password)
-        has_number = re.search(r'[0-9]', password)
-        return has_letter and has_number
-    
-    @staticmethod
-    def is_valid_email(email: str) -> bool:
-        """Validate email format."""
-        if not email:
-            return True  # Email is optional
-        email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        return re.match(email_pattern, email) is not None
+    # Kept for API compatibility; the module-level validators do the work
+    is_valid_username = staticmethod(_is_valid_username)
+    is_valid_password = staticmethod(_is_valid_password)
+    is_valid_email = staticmethod(_is_valid_email)
     
     @staticmethod
     def login_user(username: str, password: str) -> bool:
@@ -56,6 +83,14 @@ class AuthManager:
             st.session_state['user_role'] = user['role']
             st.session_state['session_id'] = session_id
             st.session_state['full_name'] = user.get('full_name', username)
+            # Cached so get_current_user doesn't rebuild the dict on every rerun
+            st.session_state['_current_user'] = {
+                'id': user['id'],
+                'username': user['username'],
+                'role': user['role'],
+                'full_name': st.session_state['full_name'],
+                'session_id': session_id
+            }
             
             return True
         return False
@@ -64,13 +99,13 @@ class AuthManager:
     def register_user(username: str, password: str, email: str = None, full_name: str = None) -> tuple[bool, str]:
         """Register a new user."""
         # Validate inputs
-        if not AuthManager.is_valid_username(username):
+        if not _is_valid_username(username):
             return False, "Username must be 3-50 characters long and contain only letters, numbers, underscores, and hyphens."
         
-        if not AuthManager.is_valid_password(password):
+        if not _is_valid_password(password):
             return False, "Password must be at least 6 characters long and contain at least one letter and one number."
         
-        if email and not AuthManager.is_valid_email(email):
+        if email and not _is_valid_email(email):
             return False, "Please enter a valid email address."
         
         # Create user
@@ -83,10 +118,13 @@ class AuthManager:
     @staticmethod
     def logout_user():
         """Log out current user and clear session."""
+        session_id = st.session_state.get('session_id')
+        if session_id:
+            db.delete_session(session_id)
+        
         # Clear Streamlit session
-        for key in ['authenticated', 'user_id', 'username', 'user_role', 'session_id', 'full_name']:
-            if key in st.session_state:
-                del st.session_state[key]
+        for key in ('authenticated', 'user_id', 'username', 'user_role', 'session_id', 'full_name', '_current_user'):
+            st.session_state.pop(key, None)
     
     @staticmethod
     def is_authenticated() -> bool:
@@ -96,23 +134,17 @@ class AuthManager:
     @staticmethod
     def get_current_user() -> Optional[Dict[str, Any]]:
         """Get current authenticated user info."""
-        if not AuthManager.is_authenticated():
-            return None
-        
-        return {
-            'id': st.session_state.get('user_id'),
-            'username': st.session_state.get('username'),
-            'role': st.session_state.get('user_role'),
-            'full_name': st.session_state.get('full_name'),
-            'session_id': st.session_state.get('session_id')
-        }
+        # Set at login and cleared at logout, so this one lookup doubles as the auth check
+        return st.session_state.get('_current_user')
     
     @staticmethod
-    def require_auth():
-        """Decorator/function to require authentication."""
-        if not AuthManager.is_authenticated():
+    def require_auth() -> Dict[str, Any]:
+        """Decorator/function to require authentication; returns the current user."""
+        user = AuthManager.get_current_user()
+        if not user:
             AuthManager.show_login_page()
             st.stop()
+        return user
     
     @staticmethod
     def show_login_page():
@@ -178,10 +210,11 @@ class AuthManager:
                         st.error(message)
     
     @staticmethod
-    def show_user_info():
+    def show_user_info(user: Optional[Dict[str, Any]] = None):
         """Display current user information in sidebar."""
-        if AuthManager.is_authenticated():
-            user = AuthManager.get_current_user()
+        # Callers that already hold the user (e.g. from require_auth) can pass it in
+        user = user or AuthManager.get_current_user()
+        if user:
             with st.sidebar:
                 st.markdown("---")
                 st.markdown(f"👤 **{user['full_name'] or user['username']}**")
@@ -193,9 +226,9 @@ class AuthManager:
 
 
 # Utility functions for backward compatibility
-def require_auth():
+def require_auth() -> Dict[str, Any]:
     """Convenience function to require authentication."""
-    AuthManager.require_auth()
+    return AuthManager.require_auth()
 
 def get_current_user_id() -> Optional[int]:
     """Get current user ID or None if not authenticated."""
@@ -4,15 +4,19 @@ Check database contents
 
 import sqlite3
 import hashlib
+import hmac
 
 def check_database():
-    conn = sqlite3.connect("notary_training.db")
+    # Read-only diagnostic: autocommit mode and no writes, so it doesn't contend with a running app
+    conn = sqlite3.connect("notary_training.db", isolation_level=None)
+    conn.execute("PRAGMA query_only = 1")
+    conn.row_factory = sqlite3.Row
     
     # Check users table
     print("=== USERS TABLE ===")
-    users = conn.execute("SELECT * FROM users").fetchall()
+    users = conn.execute("SELECT id, username, role, is_active FROM users").fetchall()
     for user in users:
-        print(f"ID: {user[0]}, Username: {user[1]}, Role: {user[5]}, Active: {user[8]}")
+        print(f"ID: {user['id']}, Username: {user['username']}, Role: {user['role']}, Active: {user['is_active']}")
     
     # Check lessons count
     print("\n=== LESSONS TABLE ===")
@@ -22,14 +26,24 @@ def check_database():
     # Test password hash
     print("\n=== PASSWORD VERIFICATION ===")
     test_password = "admin123"
-    test_hash = hashlib.sha256(test_password.encode()).hexdigest()
     
     stored_hash = conn.execute("SELECT password_hash FROM users WHERE username = 'admin'").fetchone()
     if stored_hash:
+        stored_hash = stored_hash[0]
+        if stored_hash.startswith("scrypt$"):
+            # Recompute with the work factors and salt recorded in the stored hash
+            _, n, r, p, salt, digest = stored_hash.split("$")
+            test_hash = hashlib.scrypt(test_password.encode(), salt=bytes.fromhex(salt),
+                                       n=int(n), r=int(r), p=int(p), dklen=len(digest) // 2).hex()
+            print(f"KDF: scrypt (n={n}, r={r}, p={p})")
+        else:
+            test_hash = hashlib.sha256(test_password.encode()).digest().hex()
+            digest = stored_hash
+            print("KDF: legacy SHA-256")
         print(f"Test password: {test_password}")
         print(f"Test hash: {test_hash}")
-        print(f"Stored hash: {stored_hash[0]}")
-        print(f"Match: {test_hash == stored_hash[0]}")
+        print(f"Stored hash: {stored_hash}")
+        print(f"Match: {hmac.compare_digest(test_hash, digest)}")
     
     conn.close()
 
@@ -1,27 +1,43 @@
 # ✅ completed_tracker.py（新增文件）
-import json
 import os
 
+import orjson
+
 FILE_PATH = "completed.json"
 
+# In-memory set mirroring FILE_PATH, read once on first use
+_cache = None
+
 def load_completed():
     if os.path.exists(FILE_PATH):
-        with open(FILE_PATH, "r") as f:
-            return json.load(f)
+        with open(FILE_PATH, "rb") as f:
+            return orjson.loads(f.read())
     return []
 
+def _completed():
+    global _cache
+    if _cache is None:
+        _cache = set(load_completed())
+    return _cache
+
 def save_completed(completed_list):
-    with open(FILE_PATH, "w") as f:
-        json.dump(completed_list, f)
+    global _cache
+    # Write a temp file and swap it in so a crash never leaves a half-written list
+    tmp_path = FILE_PATH + ".tmp"
+    with open(tmp_path, "wb") as f:
+        # Stored as a sorted JSON array so the file stays stable between writes
+        f.write(orjson.dumps(sorted(completed_list, key=str)))
+    os.replace(tmp_path, FILE_PATH)
+    _cache = set(completed_list)
 
 def mark_completed(lesson_no):
-    completed = load_completed()
+    completed = _completed()
     if lesson_no not in completed:
-        completed.append(lesson_no)
+        completed.add(lesson_no)
         save_completed(completed)
 
 def unmark_completed(lesson_no):
-    completed = load_completed()
+    completed = _completed()
     if lesson_no in completed:
-        completed.remove(lesson_no)
+        completed.discard(lesson_no)
         save_completed(completed)
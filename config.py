@@ -1,117 +1,124 @@
 # config.py
 import os
 import sys
+from functools import cached_property
 from typing import Optional
-from dotenv import load_dotenv
 
-# Load environment variables from .env file
-load_dotenv()
+# Load environment variables from .env file, unless disabled (LOAD_DOTENV=0) or there is none
+if os.getenv("LOAD_DOTENV", "1") == "1" and os.path.exists(".env"):
+    from dotenv import load_dotenv
+    load_dotenv()
 
 class Config:
-    """Configuration class that loads settings from environment variables."""
+    """Configuration class that loads settings from environment variables.
+    
+    Each setting is read from the environment on first access and cached on the
+    instance; delete the attribute (e.g. ``del config.APP_NAME``) to re-read it.
+    """
+    
+    # Set once the first instance has validated the environment
+    _validated = False
     
     def __init__(self):
-        self._validate_required_env_vars()
+        if not Config._validated:
+            self._validate_required_env_vars()
+            Config._validated = True
     
-    @property
+    @cached_property
     def API_PROVIDER(self) -> str:
         """Current API provider (openai or deepseek)."""
         return os.getenv("API_PROVIDER", "openai").lower()
     
-    @property
+    @cached_property
     def OPENAI_API_KEY(self) -> str:
         """OpenAI API key from environment variables."""
         return os.getenv("OPENAI_API_KEY", "")
     
-    @property
+    @cached_property
     def OPENAI_API_URL(self) -> str:
         """OpenAI API URL from environment variables."""
         return os.getenv("OPENAI_API_URL", "https://api.openai.com/v1/chat/completions")
     
-    @property
+    @cached_property
     def OPENAI_MODEL(self) -> str:
         """OpenAI model name from environment variables."""
         return os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
     
-    @property
+    @cached_property
     def DEEPSEEK_API_KEY(self) -> str:
         """DeepSeek API key from environment variables."""
         return os.getenv("DEEPSEEK_API_KEY", "")
     
-    @property
+    @cached_property
     def DEEPSEEK_API_URL(self) -> str:
         """DeepSeek API URL from environment variables."""
         return os.getenv("DEEPSEEK_API_URL", "https://api.deepseek.com/v1/chat/completions")
     
-    @property
+    @cached_property
     def DEEPSEEK_MODEL(self) -> str:
         """DeepSeek model name from environment variables."""
         return os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
     
-    @property
+    @cached_property
     def CURRENT_API_KEY(self) -> str:
         """Get API key for current provider."""
-        if self.API_PROVIDER == "openai":
-            return self.OPENAI_API_KEY
-        else:
-            return self.DEEPSEEK_API_KEY
+        return self.OPENAI_API_KEY if self.API_PROVIDER == "openai" else self.DEEPSEEK_API_KEY
     
-    @property
+    @cached_property
     def CURRENT_API_URL(self) -> str:
         """Get API URL for current provider."""
-        if self.API_PROVIDER == "openai":
-            return self.OPENAI_API_URL
-        else:
-            return self.DEEPSEEK_API_URL
+        return self.OPENAI_API_URL if self.API_PROVIDER == "openai" else self.DEEPSEEK_API_URL
     
-    @property
+    @cached_property
     def CURRENT_MODEL(self) -> str:
         """Get model name for current provider."""
-        if self.API_PROVIDER == "openai":
-            return self.OPENAI_MODEL
-        else:
-            return self.DEEPSEEK_MODEL
+        return self.OPENAI_MODEL if self.API_PROVIDER == "openai" else self.DEEPSEEK_MODEL
     
-    @property
+    @cached_property
     def APP_NAME(self) -> str:
         """Application name."""
         return os.getenv("APP_NAME", "Notary Training System")
     
-    @property
+    @cached_property
     def MAX_CONTENT_LENGTH(self) -> int:
         """Maximum content length for processing."""
         return int(os.getenv("MAX_CONTENT_LENGTH", "12000"))
     
-    @property
+    @cached_property
     def DEFAULT_TEMPERATURE(self) -> float:
         """Default temperature for AI responses."""
         return float(os.getenv("DEFAULT_TEMPERATURE", "0.2"))
     
-    @property
+    @cached_property
     def DEFAULT_MAX_TOKENS(self) -> int:
         """Default max tokens for AI responses."""
         return int(os.getenv("DEFAULT_MAX_TOKENS", "800"))
     
-    @property
+    @cached_property
     def RATE_LIMIT_PER_MINUTE(self) -> int:
         """Rate limit per minute for API calls."""
         return int(os.getenv("RATE_LIMIT_PER_MINUTE", "30"))
     
-    @property
+    @cached_property
     def SESSION_TIMEOUT_MINUTES(self) -> int:
         """Session timeout in minutes."""
         return int(os.getenv("SESSION_TIMEOUT_MINUTES", "60"))
     
-    @property
+    @cached_property
     def ENABLE_RESPONSE_CACHING(self) -> bool:
         """Enable response caching for better performance."""
         return os.getenv("ENABLE_RESPONSE_CACHING", "true").lower() == "true"
     
-    @property
+    @cached_property
     def CACHE_DURATION_MINUTES(self) -> int:
         """Cache duration in minutes."""
         return int(os.getenv("CACHE_DURATION_MINUTES", "60"))
     
+    @cached_property
+    def LESSON_CACHE_DURATION_MINUTES(self) -> int:
+        """Cache duration in minutes for generated lesson content (default 30 days)."""
+        return int(os.getenv("LESSON_CACHE_DURATION_MINUTES", "43200"))
+    
     def _validate_required_env_vars(self) -> None:
         """Validate that all required environment variables are set."""
         api_provider = self.API_PROVIDER
@@ -121,18 +128,23 @@ class Config:
         else:
             required_key = "DEEPSEEK_API_KEY"
         
-        if not os.getenv(required_key):
+        if not self.CURRENT_API_KEY:
             print(f"❌ Missing required API key: {required_key}")
             print(f"Current API provider: {api_provider}")
             print("Please check your .env file or environment configuration.")
             sys.exit(1)
     
-    def get_api_headers(self) -> dict:
-        """Get headers for API requests."""
+    @cached_property
+    def _api_headers(self) -> dict:
+        """Headers for the current provider, built on first use."""
         return {
             "Authorization": f"Bearer {self.CURRENT_API_KEY}",
             "Content-Type": "application/json"
         }
+    
+    def get_api_headers(self) -> dict:
+        """Get headers for API requests (a copy, so callers may modify it)."""
+        return dict(self._api_headers)
 
 # Create global config instance
 config = Config()
@@ -4,9 +4,15 @@ Provides SQLite database operations for user management, progress tracking, and
 """
 
 import sqlite3
+import csv
+import atexit
 import hashlib
-import uuid
-from datetime import datetime, timedelta
+import hmac
+import queue
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
 from typing import Optional, List, Dict, Any
 from contextlib import contextmanager
 import json
@@ -14,26 +20,329 @@ import os
 
 DB_PATH = "notary_training.db"
 
+# scrypt work factors for password hashing (n=2**14, r=8 uses ~16 MiB per hash)
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+# Idle connections kept open by the connection pool
+POOL_SIZE = 8
+
+# Deferred writes are committed together, at most this many per transaction
+WRITE_BEHIND_INTERVAL_SECONDS = 0.2
+WRITE_BEHIND_BATCH_SIZE = 50
+
+# get_user_by_session results are reused for this long (bounded to this many sessions)
+SESSION_CACHE_TTL_SECONDS = 30
+SESSION_CACHE_SIZE = 1024
+
+# The WAL is checkpointed by a background thread this often instead of by a committing writer
+WAL_CHECKPOINT_INTERVAL_SECONDS = 30
+# Safety net if the background checkpoints fall behind: a commit checkpoints inline past this many pages
+WAL_AUTOCHECKPOINT_PAGES = 10000  # ~40 MB at the default 4 KB page size
+# Once fully checkpointed, the WAL file is truncated back to at most this size
+WAL_SIZE_LIMIT_BYTES = 64 * 1024 * 1024
+
+# Upsert for one user_progress row; NULL parameters keep the stored value
+UPSERT_PROGRESS_SQL = """
+    INSERT INTO user_progress 
+    (user_id, lesson_no, current_index, is_completed, completion_date, time_spent, updated_at)
+    VALUES (:user_id, :lesson_no, COALESCE(:current_index, 0), COALESCE(:is_completed, 0),
+            :completion_date, COALESCE(:time_spent, 0), CURRENT_TIMESTAMP)
+    ON CONFLICT(user_id, lesson_no) DO UPDATE SET
+        current_index = COALESCE(:current_index, current_index),
+        is_completed = COALESCE(:is_completed, is_completed),
+        completion_date = CASE WHEN :is_completed IS NULL
+                               THEN completion_date ELSE :completion_date END,
+        time_spent = COALESCE(:time_spent, time_spent),
+        updated_at = CURRENT_TIMESTAMP
+"""
+
+# Hot-path statements, shared so each connection's statement cache keeps them prepared
+
+# Active user row for a login attempt
+AUTHENTICATE_USER_SQL = """
+    SELECT id, username, email, full_name, role, is_active, password_hash
+    FROM users 
+    WHERE username = ? AND is_active = 1
+"""
+
+UPDATE_LAST_LOGIN_SQL = """
+    UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?
+"""
+
+# Session bookkeeping, run on every login and page load
+CREATE_SESSION_SQL = """
+    INSERT INTO sessions (id, user_id, expires_at, ip_address, user_agent)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+USER_BY_SESSION_SQL = """
+    SELECT u.id, u.username, u.email, u.full_name, u.role
+    FROM users u
+    JOIN sessions s ON u.id = s.user_id
+    WHERE s.id = ? AND s.expires_at > ? AND u.is_active = 1
+"""
+
+# Attempt number is worked out by the INSERT itself, so it stays a single statement
+SAVE_QUIZ_ATTEMPT_SQL = """
+    INSERT INTO quiz_attempts 
+    (user_id, lesson_no, attempt_number, score, total_questions, time_taken, answers)
+    SELECT :user_id, :lesson_no, COALESCE(MAX(attempt_number), 0) + 1,
+           :score, :total_questions, :time_taken, :answers
+    FROM quiz_attempts 
+    WHERE user_id = :user_id AND lesson_no = :lesson_no
+"""
+
+SAVE_QA_INTERACTION_SQL = """
+    INSERT INTO qa_history (user_id, lesson_no, question, answer, detail_level)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose commit() can be held back by DatabaseManager.transaction."""
+    
+    # While set, commit() is a no-op so an enclosing transaction stays open
+    hold_commits = False
+    
+    def commit(self):
+        if not self.hold_commits:
+            super().commit()
+
+
+class ConnectionPool:
+    """Bounded LIFO pool of pre-configured SQLite connections.
+    
+    Connections are shared across threads (Streamlit reruns hop threads), so
+    each one is handed to a single caller at a time. When the pool is empty a
+    fresh connection is opened, and surplus connections are closed on return.
+    """
+    
+    def __init__(self, db_path: str, size: int = POOL_SIZE):
+        self.db_path = db_path
+        self._idle = queue.LifoQueue(maxsize=size)
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Open a new connection with the pragmas every caller relies on."""
+        # Room for every distinct statement the app issues, so none is re-prepared
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=256,
+                               factory=PooledConnection)
+        conn.row_factory = sqlite3.Row  # Enable column access by name
+        # journal_mode=WAL is persistent and set once in init_database
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-64000")  # ~64 MB page cache
+        conn.execute("PRAGMA mmap_size=268435456")  # map up to 256 MB of the file
+        # Normally DatabaseManager._checkpoint_loop keeps the WAL short, so this never fires
+        conn.execute(f"PRAGMA wal_autocheckpoint={WAL_AUTOCHECKPOINT_PAGES}")
+        conn.execute(f"PRAGMA journal_size_limit={WAL_SIZE_LIMIT_BYTES}")
+        return conn
+    
+    def acquire(self) -> sqlite3.Connection:
+        """Check a connection out of the pool."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+    
+    def release(self, conn: sqlite3.Connection):
+        """Return a connection, discarding any work left uncommitted."""
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+    
+    def close_all(self):
+        """Close every idle connection (connections checked out are closed on return)."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class WriteBehindQueue:
+    """Background writer that commits queued statements in batched transactions.
+    
+    Statements queued within WRITE_BEHIND_INTERVAL_SECONDS of each other share
+    one transaction (and one fsync). Anything still queued is flushed at exit.
+    """
+    
+    def __init__(self, manager: 'DatabaseManager'):
+        self._manager = manager
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="db-write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+    
+    def put(self, sql: str, params):
+        """Queue a statement for the background writer."""
+        self._queue.put((sql, params))
+    
+    def flush(self):
+        """Block until every queued statement has been committed."""
+        self._queue.join()
+    
+    def _next_batch(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + WRITE_BEHIND_INTERVAL_SECONDS
+        while len(batch) < WRITE_BEHIND_BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+    
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                with self._manager.get_connection(write=True) as conn:
+                    try:
+                        for sql, params in batch:
+                            conn.execute(sql, params)
+                        conn.commit()
+                    except sqlite3.Error:
+                        # Retry one by one so a single bad statement doesn't drop the others
+                        conn.rollback()
+                        for sql, params in batch:
+                            try:
+                                conn.execute(sql, params)
+                                conn.commit()
+                            except sqlite3.Error as e:
+                                conn.rollback()
+                                print(f"Error applying queued write: {e}")
+            except Exception as e:
+                print(f"Error applying queued writes: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+
 class DatabaseManager:
     """Manages all database operations for the Notary Training System."""
     
     def __init__(self, db_path: str = DB_PATH):
         self.db_path = db_path
+        self._pool = ConnectionPool(db_path)
+        # Connection held by the current thread, so nested get_connection calls reuse it
+        self._local = threading.local()
+        # SQLite allows one writer at a time; queue writers here instead of on SQLITE_BUSY.
+        # Reentrant so a write block nested in another on the same thread doesn't deadlock
+        self._write_lock = threading.RLock()
+        # session_id -> (user info, monotonic time fetched), oldest first
+        self._session_cache: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._session_cache_lock = threading.Lock()
+        # Registered before the write-behind queue so queued writes are flushed first
+        atexit.register(self.close_all)
         self.init_database()
+        self._writes = WriteBehindQueue(self)
+        threading.Thread(target=self._checkpoint_loop, name="db-wal-checkpoint", daemon=True).start()
     
     @contextmanager
-    def get_connection(self):
-        """Context manager for database connections."""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row  # Enable column access by name
+    def get_connection(self, write: bool = False):
+        """Context manager for database connections checked out of the pool.
+        
+        Pass write=True for blocks that modify the database so that writers
+        from different sessions are serialized. A thread that already holds a
+        connection gets the same one back; it returns to the pool when the
+        outermost block exits.
+        """
+        conn = getattr(self._local, "conn", None)
+        outermost = conn is None
+        if outermost:
+            conn = self._local.conn = self._pool.acquire()
         try:
-            yield conn
+            if write:
+                with self._write_lock:
+                    yield conn
+            else:
+                yield conn
         finally:
-            conn.close()
+            if outermost:
+                self._local.conn = None
+                self._pool.release(conn)
+    
+    @contextmanager
+    def transaction(self):
+        """Run a block of DatabaseManager calls as one BEGIN IMMEDIATE transaction.
+        
+        The writer lock is taken once up front and the block commits once at
+        the end (or rolls back on error); commits issued by the methods called
+        inside are held back until then. Deferred writes are still applied by
+        the background writer after the block.
+        """
+        with self.get_connection(write=True) as conn:
+            # Manual transaction control, so the driver doesn't open its own around each statement
+            conn.isolation_level = None
+            conn.hold_commits = True
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    yield conn
+                except BaseException:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    raise
+                if conn.in_transaction:
+                    conn.execute("COMMIT")
+            finally:
+                conn.hold_commits = False
+                conn.isolation_level = ""
+    
+    def close_all(self):
+        """Close the pooled connections, e.g. at shutdown."""
+        self._pool.close_all()
+    
+    def _checkpoint_loop(self):
+        """Checkpoint the WAL periodically so no request's COMMIT has to."""
+        # A connection of its own, so checkpoints never wait for a pooled one. The short
+        # timeout bounds how long a TRUNCATE may hold up writers waiting on old readers
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=1)
+        conn.execute(f"PRAGMA journal_size_limit={WAL_SIZE_LIMIT_BYTES}")
+        while True:
+            time.sleep(WAL_CHECKPOINT_INTERVAL_SECONDS)
+            try:
+                # PASSIVE copies what it can without blocking readers or writers
+                busy, log_pages, checkpointed = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+                if log_pages > 0 and checkpointed < log_pages:
+                    # A reader held an old snapshot; wait for it so the log is backfilled
+                    # and reset instead of growing past what PASSIVE can reclaim
+                    busy, log_pages, checkpointed = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+                    if busy:
+                        print(f"WAL checkpoint incomplete: {checkpointed}/{log_pages} pages copied")
+            except sqlite3.Error as e:
+                print(f"Error checkpointing WAL: {e}")
+    
+    def _defer_write(self, sql: str, params, flush: bool = False):
+        """Hand a statement to the write-behind queue, or commit it now if flush=True.
+        
+        A flushed write first waits for everything queued before it, then runs
+        on the caller's thread so that a failure raises instead of only being logged.
+        """
+        if not flush:
+            self._writes.put(sql, params)
+            return
+        self._writes.flush()
+        with self.get_connection(write=True) as conn:
+            conn.execute(sql, params)
+            conn.commit()
+    
+    def flush_writes(self):
+        """Block until all deferred writes have been committed."""
+        self._writes.flush()
     
     def init_database(self):
         """Initialize database with all required tables."""
-        with self.get_connection() as conn:
+        with self.get_connection(write=True) as conn:
+            # WAL lets readers keep going while a write commits; stored in the database file
+            conn.execute("PRAGMA journal_mode=WAL")
+            
             # Users table
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS users (
@@ -52,10 +361,10 @@ class DatabaseManager:
             # Sessions table for authentication
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS sessions (
-                    id TEXT PRIMARY KEY,
+                    id BLOB PRIMARY KEY,
                     user_id INTEGER NOT NULL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    expires_at TIMESTAMP NOT NULL,
+                    expires_at INTEGER NOT NULL,  -- epoch seconds
                     ip_address TEXT,
                     user_agent TEXT,
                     FOREIGN KEY (user_id) REFERENCES users (id)
@@ -67,6 +376,7 @@ class DatabaseManager:
                 CREATE TABLE IF NOT EXISTS lessons (
                     id INTEGER PRIMARY KEY,
                     lesson_no TEXT UNIQUE NOT NULL,
+                    lesson_no_int INTEGER GENERATED ALWAYS AS (CAST(lesson_no AS INTEGER)) VIRTUAL,
                     title TEXT NOT NULL,
                     content TEXT NOT NULL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -148,24 +458,165 @@ class DatabaseManager:
                 )
             """)
             
+            # Generated quizzes, keyed by a digest of the lesson and question count
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS quiz_cache (
+                    key BLOB PRIMARY KEY,
+                    quizzes_json TEXT NOT NULL,
+                    created_at INTEGER NOT NULL  -- epoch seconds
+                ) WITHOUT ROWID
+            """)
+            
+            # Per-user totals for get_user_analytics, kept current by the triggers below
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS user_stats (
+                    user_id INTEGER PRIMARY KEY,
+                    lessons_attempted INTEGER NOT NULL DEFAULT 0,
+                    completed_lessons INTEGER NOT NULL DEFAULT 0,
+                    total_time_spent INTEGER NOT NULL DEFAULT 0,
+                    quizzes_taken INTEGER NOT NULL DEFAULT 0,
+                    scored_quizzes INTEGER NOT NULL DEFAULT 0,  -- attempts with a usable percentage
+                    sum_score_pct REAL NOT NULL DEFAULT 0,
+                    best_score_pct REAL,
+                    FOREIGN KEY (user_id) REFERENCES users (id)
+                )
+            """)
+            
+            self._migrate_lessons_table(conn)
+            self._migrate_sessions_table(conn)
+            self._create_user_stats_triggers(conn)
             conn.commit()
-            self._create_indexes()
+        self._create_indexes()
+    
+    def _migrate_lessons_table(self, conn):
+        """Add the numeric lesson_no_int column to databases created before it existed."""
+        columns = {row['name'] for row in conn.execute("PRAGMA table_xinfo(lessons)")}
+        if 'lesson_no_int' not in columns:
+            # ALTER TABLE can only add VIRTUAL columns; the index stores the computed values
+            conn.execute("""
+                ALTER TABLE lessons ADD COLUMN
+                lesson_no_int INTEGER GENERATED ALWAYS AS (CAST(lesson_no AS INTEGER)) VIRTUAL
+            """)
+            # The old expression index took this name; rebuild it on the column
+            conn.execute("DROP INDEX IF EXISTS idx_lessons_no_int")
+    
+    def _migrate_sessions_table(self, conn):
+        """Convert expiry times stored as datetime text to epoch seconds."""
+        # Text always sorts above integers in SQLite, so unconverted rows would never expire
+        conn.execute("""
+            UPDATE sessions SET expires_at = CAST(strftime('%s', expires_at) AS INTEGER)
+            WHERE typeof(expires_at) = 'text'
+        """)
+    
+    def _create_user_stats_triggers(self, conn):
+        """Maintain user_stats on every progress/quiz write, backfilling it the first time."""
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_user_stats_progress_insert'"
+        ).fetchone()
+        if exists:
+            return
+        
+        # Rebuild from the source tables; rows written from here on are counted by the triggers
+        conn.execute("DELETE FROM user_stats")
+        conn.execute("""
+            INSERT INTO user_stats (user_id, lessons_attempted, completed_lessons, total_time_spent)
+            SELECT user_id, COUNT(*), COUNT(*) FILTER (WHERE is_completed = 1), COALESCE(SUM(time_spent), 0)
+            FROM user_progress
+            GROUP BY user_id
+        """)
+        conn.execute("""
+            INSERT INTO user_stats (user_id, quizzes_taken, scored_quizzes, sum_score_pct, best_score_pct)
+            SELECT user_id, COUNT(*), COUNT(CAST(score AS FLOAT) / total_questions),
+                   COALESCE(SUM(CAST(score AS FLOAT) / total_questions * 100), 0),
+                   MAX(CAST(score AS FLOAT) / total_questions * 100)
+            FROM quiz_attempts
+            WHERE true
+            GROUP BY user_id
+            ON CONFLICT(user_id) DO UPDATE SET
+                quizzes_taken = excluded.quizzes_taken,
+                scored_quizzes = excluded.scored_quizzes,
+                sum_score_pct = excluded.sum_score_pct,
+                best_score_pct = excluded.best_score_pct
+        """)
+        
+        conn.execute("""
+            CREATE TRIGGER trg_user_stats_progress_insert AFTER INSERT ON user_progress
+            BEGIN
+                INSERT INTO user_stats (user_id, lessons_attempted, completed_lessons, total_time_spent)
+                VALUES (NEW.user_id, 1, NEW.is_completed = 1, COALESCE(NEW.time_spent, 0))
+                ON CONFLICT(user_id) DO UPDATE SET
+                    lessons_attempted = lessons_attempted + 1,
+                    completed_lessons = completed_lessons + excluded.completed_lessons,
+                    total_time_spent = total_time_spent + excluded.total_time_spent;
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER trg_user_stats_progress_update AFTER UPDATE OF is_completed, time_spent ON user_progress
+            BEGIN
+                UPDATE user_stats SET
+                    completed_lessons = completed_lessons + (NEW.is_completed = 1) - (OLD.is_completed = 1),
+                    total_time_spent = total_time_spent + COALESCE(NEW.time_spent, 0) - COALESCE(OLD.time_spent, 0)
+                WHERE user_id = NEW.user_id;
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER trg_user_stats_progress_delete AFTER DELETE ON user_progress
+            BEGIN
+                UPDATE user_stats SET
+                    lessons_attempted = lessons_attempted - 1,
+                    completed_lessons = completed_lessons - (OLD.is_completed = 1),
+                    total_time_spent = total_time_spent - COALESCE(OLD.time_spent, 0)
+                WHERE user_id = OLD.user_id;
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER trg_user_stats_quiz_insert AFTER INSERT ON quiz_attempts
+            BEGIN
+                INSERT INTO user_stats (user_id, quizzes_taken, scored_quizzes, sum_score_pct, best_score_pct)
+                VALUES (NEW.user_id, 1, (CAST(NEW.score AS FLOAT) / NEW.total_questions) IS NOT NULL,
+                        COALESCE(CAST(NEW.score AS FLOAT) / NEW.total_questions * 100, 0),
+                        CAST(NEW.score AS FLOAT) / NEW.total_questions * 100)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    quizzes_taken = quizzes_taken + 1,
+                    scored_quizzes = scored_quizzes + excluded.scored_quizzes,
+                    sum_score_pct = sum_score_pct + excluded.sum_score_pct,
+                    best_score_pct = COALESCE(MAX(best_score_pct, excluded.best_score_pct),
+                                              best_score_pct, excluded.best_score_pct);
+            END
+        """)
     
     def _create_indexes(self):
         """Create database indexes for better performance."""
-        with self.get_connection() as conn:
+        with self.get_connection(write=True) as conn:
             indexes = [
                 "CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions (user_id)",
                 "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)",
                 "CREATE INDEX IF NOT EXISTS idx_progress_user_lesson ON user_progress (user_id, lesson_no)",
                 "CREATE INDEX IF NOT EXISTS idx_quiz_user_lesson ON quiz_attempts (user_id, lesson_no)",
+                "CREATE INDEX IF NOT EXISTS idx_quiz_user_created ON quiz_attempts (user_id, created_at DESC)",
                 "CREATE INDEX IF NOT EXISTS idx_qa_user_lesson ON qa_history (user_id, lesson_no)",
-                "CREATE INDEX IF NOT EXISTS idx_final_test_user ON final_test_attempts (user_id)",
+                "CREATE INDEX IF NOT EXISTS idx_final_user_date ON final_test_attempts (user_id, created_at DESC)",
+                "CREATE INDEX IF NOT EXISTS idx_lessons_no_int ON lessons (lesson_no_int)",
+                "CREATE INDEX IF NOT EXISTS idx_users_created_at ON users (created_at)",
+                "CREATE INDEX IF NOT EXISTS idx_users_created_date ON users (DATE(created_at))",
+                # Covering indexes: these queries never touch the table rows
+                "CREATE INDEX IF NOT EXISTS idx_sessions_id_expires ON sessions (id, expires_at, user_id)",
+                "CREATE INDEX IF NOT EXISTS idx_progress_user_cov ON user_progress (user_id, is_completed, time_spent)",
+                "CREATE INDEX IF NOT EXISTS idx_quiz_user_cov ON quiz_attempts (user_id, score, total_questions)",
+                # Superseded by idx_final_user_date
+                "DROP INDEX IF EXISTS idx_final_test_user",
             ]
             
             for index_sql in indexes:
                 conn.execute(index_sql)
             
+            # Give the planner statistics for the new indexes: a full ANALYZE the
+            # first time, afterwards only where SQLite thinks they are stale
+            has_stats = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+            ).fetchone()
+            conn.execute("PRAGMA optimize" if has_stats else "ANALYZE")
+            
             conn.commit()
     
     # User Management Methods
@@ -173,7 +624,7 @@ class DatabaseManager:
         """Create a new user account."""
         password_hash = self._hash_password(password)
         
-        with self.get_connection() as conn:
+        with self.get_connection(write=True) as conn:
             try:
                 cursor = conn.execute("""
                     INSERT INTO users (username, password_hash, email, full_name)
@@ -186,81 +637,170 @@ class DatabaseManager:
     
     def authenticate_user(self, username: str, password: str) -> Optional[Dict]:
         """Authenticate user and return user info if successful."""
-        password_hash = self._hash_password(password)
-        
         with self.get_connection() as conn:
-            user = conn.execute("""
-                SELECT id, username, email, full_name, role, is_active
-                FROM users 
-                WHERE username = ? AND password_hash = ? AND is_active = 1
-            """, (username, password_hash)).fetchone()
-            
-            if user:
+            user = conn.execute(AUTHENTICATE_USER_SQL, (username,)).fetchone()
+        
+        # The password check is deliberately slow, so it runs without holding the write lock
+        if user and self._verify_password(password, user['password_hash']):
+            # Upgrade legacy SHA-256 hashes now that we have the plain-text password
+            new_hash = None if user['password_hash'].startswith("scrypt$") else self._hash_password(password)
+            with self.get_connection(write=True) as conn:
                 # Update last login
-                conn.execute("""
-                    UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?
-                """, (user['id'],))
+                conn.execute(UPDATE_LAST_LOGIN_SQL, (user['id'],))
+                if new_hash:
+                    conn.execute("UPDATE users SET password_hash = ? WHERE id = ?", (new_hash, user['id']))
                 conn.commit()
-                
-                return dict(user)
+            
+            user_info = dict(user)
+            del user_info['password_hash']
+            return user_info
         return None
     
-    def create_session(self, user_id: int, ip_address: str = None, user_agent: str = None) -> str:
+    def update_user_password(self, user_id: int, password: str):
+        """Replace a user's password."""
+        password_hash = self._hash_password(password)
+        
+        with self.get_connection(write=True) as conn:
+            conn.execute("UPDATE users SET password_hash = ? WHERE id = ?", (password_hash, user_id))
+            conn.commit()
+    
+    def apply_user_edits(self, edits: List[Dict]):
+        """Apply queued role/status/password edits in a single transaction.
+        
+        Each edit holds ``user_id``, ``role``, ``is_active`` and an optional
+        plain-text ``password``; users without a new password keep their hash.
+        """
+        rows = [
+            (
+                edit['role'],
+                edit['is_active'],
+                self._hash_password(edit['password']) if edit.get('password') else None,
+                edit['user_id'],
+            )
+            for edit in edits
+        ]
+        
+        with self.get_connection(write=True) as conn:
+            conn.executemany("""
+                UPDATE users
+                SET role = ?, is_active = ?, password_hash = COALESCE(?, password_hash)
+                WHERE id = ?
+            """, rows)
+            conn.commit()
+    
+    def create_session(self, user_id: int, ip_address: str = None, user_agent: str = None) -> bytes:
         """Create a new user session."""
-        session_id = str(uuid.uuid4())
-        expires_at = datetime.now() + timedelta(hours=24)  # 24 hour sessions
+        # 16 random bytes stored as a BLOB: same entropy as a UUID4, less than half the key size
+        session_id = os.urandom(16)
+        expires_at = int(time.time()) + 24 * 60 * 60  # 24 hour sessions
         
-        with self.get_connection() as conn:
-            conn.execute("""
-                INSERT INTO sessions (id, user_id, expires_at, ip_address, user_agent)
-                VALUES (?, ?, ?, ?, ?)
-            """, (session_id, user_id, expires_at, ip_address, user_agent))
+        with self.get_connection(write=True) as conn:
+            conn.execute(CREATE_SESSION_SQL, (session_id, user_id, expires_at, ip_address, user_agent))
             conn.commit()
         
         return session_id
     
-    def get_user_by_session(self, session_id: str) -> Optional[Dict]:
-        """Get user info from session ID."""
+    def get_user_by_session(self, session_id: bytes) -> Optional[Dict]:
+        """Get user info from session ID.
+        
+        Results are cached for SESSION_CACHE_TTL_SECONDS, so a session may
+        keep resolving for up to that long after it expires.
+        """
+        now = time.monotonic()
+        with self._session_cache_lock:
+            entry = self._session_cache.get(session_id)
+            if entry is not None and now - entry[1] < SESSION_CACHE_TTL_SECONDS:
+                return dict(entry[0])
+        
         with self.get_connection() as conn:
-            result = conn.execute("""
-                SELECT u.id, u.username, u.email, u.full_name, u.role
-                FROM users u
-                JOIN sessions s ON u.id = s.user_id
-                WHERE s.id = ? AND s.expires_at > CURRENT_TIMESTAMP AND u.is_active = 1
-            """, (session_id,)).fetchone()
-            
-            return dict(result) if result else None
+            result = conn.execute(USER_BY_SESSION_SQL, (session_id, int(time.time()))).fetchone()
+        if not result:
+            return None
+        
+        user_info = dict(result)
+        with self._session_cache_lock:
+            self._session_cache[session_id] = (user_info, now)
+            self._session_cache.move_to_end(session_id)
+            if len(self._session_cache) > SESSION_CACHE_SIZE:
+                self._session_cache.popitem(last=False)
+        # Callers get their own copy so the cached entry can't be modified
+        return dict(user_info)
+    
+    def delete_session(self, session_id: bytes):
+        """End a session, e.g. on logout."""
+        with self._session_cache_lock:
+            self._session_cache.pop(session_id, None)
+        with self.get_connection(write=True) as conn:
+            conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            conn.commit()
     
     def cleanup_expired_sessions(self):
         """Remove expired sessions from database."""
-        with self.get_connection() as conn:
-            conn.execute("DELETE FROM sessions WHERE expires_at <= CURRENT_TIMESTAMP")
+        with self.get_connection(write=True) as conn:
+            conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (int(time.time()),))
             conn.commit()
+        with self._session_cache_lock:
+            self._session_cache.clear()
     
     # Progress Tracking Methods
-    def update_user_progress(self, user_id: int, lesson_no: str, current_index: int = 0, 
-                           is_completed: bool = False, time_spent: int = 0):
-        """Update user progress for a lesson."""
-        with self.get_connection() as conn:
-            completion_date = datetime.now().isoformat() if is_completed else None
-            
-            conn.execute("""
-                INSERT OR REPLACE INTO user_progress 
-                (user_id, lesson_no, current_index, is_completed, completion_date, time_spent, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-            """, (user_id, lesson_no, current_index, is_completed, completion_date, time_spent))
+    def update_user_progress(self, user_id: int, lesson_no: str, current_index: Optional[int] = None, 
+                           is_completed: Optional[bool] = None, time_spent: Optional[int] = None,
+                           flush: bool = False):
+        """Update user progress for a lesson.
+        
+        Fields left as None keep their stored value (or the column default
+        for a new row), so one statement covers both insert and update.
+        The write is deferred unless flush=True.
+        """
+        params = {
+            'user_id': user_id,
+            'lesson_no': lesson_no,
+            'current_index': current_index,
+            'is_completed': is_completed,
+            'completion_date': datetime.now().isoformat() if is_completed else None,
+            'time_spent': time_spent,
+        }
+        
+        self._defer_write(UPSERT_PROGRESS_SQL, params, flush)
+    
+    def mark_lessons_completed(self, user_id: int, lesson_nos: List[str]):
+        """Mark several lessons completed with one statement in one transaction."""
+        completion_date = datetime.now().isoformat()
+        params = [{
+            'user_id': user_id,
+            'lesson_no': str(lesson_no),
+            'current_index': None,
+            'is_completed': True,
+            'completion_date': completion_date,
+            'time_spent': None,
+        } for lesson_no in lesson_nos]
+        
+        with self.get_connection(write=True) as conn:
+            conn.executemany(UPSERT_PROGRESS_SQL, params)
             conn.commit()
     
     def get_user_progress(self, user_id: int) -> Dict[str, Any]:
         """Get all progress data for a user."""
         with self.get_connection() as conn:
-            progress = conn.execute("""
+            # Plain tuples on this cursor only; the dicts are built from the known column order
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            progress = cursor.execute("""
                 SELECT lesson_no, current_index, is_completed, completion_date, time_spent
                 FROM user_progress 
                 WHERE user_id = ?
             """, (user_id,)).fetchall()
-            
-            return {row['lesson_no']: dict(row) for row in progress}
+        
+        return {
+            lesson_no: {
+                'lesson_no': lesson_no,
+                'current_index': current_index,
+                'is_completed': is_completed,
+                'completion_date': completion_date,
+                'time_spent': time_spent,
+            }
+            for lesson_no, current_index, is_completed, completion_date, time_spent in progress
+        }
     
     def get_completed_lessons(self, user_id: int) -> List[str]:
         """Get list of completed lesson numbers for a user."""
@@ -274,29 +814,23 @@ class DatabaseManager:
     
     # Quiz and Assessment Methods
     def save_quiz_attempt(self, user_id: int, lesson_no: str, score: int, 
-                         total_questions: int, time_taken: int, answers: Dict):
-        """Save a quiz attempt."""
-        with self.get_connection() as conn:
-            # Get attempt number
-            attempt_num = conn.execute("""
-                SELECT COALESCE(MAX(attempt_number), 0) + 1 
-                FROM quiz_attempts 
-                WHERE user_id = ? AND lesson_no = ?
-            """, (user_id, lesson_no)).fetchone()[0]
-            
-            conn.execute("""
-                INSERT INTO quiz_attempts 
-                (user_id, lesson_no, attempt_number, score, total_questions, time_taken, answers)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (user_id, lesson_no, attempt_num, score, total_questions, time_taken, json.dumps(answers)))
-            conn.commit()
+                         total_questions: int, time_taken: int, answers: Dict, flush: bool = False):
+        """Save a quiz attempt (deferred unless flush=True)."""
+        self._defer_write(SAVE_QUIZ_ATTEMPT_SQL, {
+            'user_id': user_id,
+            'lesson_no': lesson_no,
+            'score': score,
+            'total_questions': total_questions,
+            'time_taken': time_taken,
+            'answers': json.dumps(answers),
+        }, flush)
     
     def save_final_test_attempt(self, user_id: int, score: int, total_questions: int, 
                                time_taken: int, answers: Dict):
         """Save a final test attempt."""
         passed = score >= (total_questions * 0.8)  # 80% pass rate
         
-        with self.get_connection() as conn:
+        with self.get_connection(write=True) as conn:
             conn.execute("""
                 INSERT INTO final_test_attempts 
                 (user_id, score, total_questions, time_taken, passed, answers)
@@ -305,71 +839,72 @@ class DatabaseManager:
             conn.commit()
     
     def save_qa_interaction(self, user_id: int, lesson_no: str, question: str, 
-                           answer: str, detail_level: str):
-        """Save a Q&A interaction."""
-        with self.get_connection() as conn:
-            conn.execute("""
-                INSERT INTO qa_history (user_id, lesson_no, question, answer, detail_level)
-                VALUES (?, ?, ?, ?, ?)
-            """, (user_id, lesson_no, question, answer, detail_level))
-            conn.commit()
+                           answer: str, detail_level: str, flush: bool = False):
+        """Save a Q&A interaction (deferred unless flush=True)."""
+        self._defer_write(SAVE_QA_INTERACTION_SQL, (user_id, lesson_no, question, answer, detail_level), flush)
     
     # Analytics Methods
     def get_user_analytics(self, user_id: int) -> Dict[str, Any]:
         """Get comprehensive analytics for a user."""
         with self.get_connection() as conn:
-            # Basic progress stats
-            progress_stats = conn.execute("""
-                SELECT 
-                    COUNT(*) as total_lessons_attempted,
-                    SUM(CASE WHEN is_completed = 1 THEN 1 ELSE 0 END) as completed_lessons,
-                    SUM(time_spent) as total_time_spent
-                FROM user_progress 
-                WHERE user_id = ?
-            """, (user_id,)).fetchone()
-            
-            # Quiz performance
-            quiz_stats = conn.execute("""
-                SELECT 
-                    COUNT(*) as total_quizzes_taken,
-                    AVG(CAST(score AS FLOAT) / total_questions * 100) as avg_score,
-                    MAX(CAST(score AS FLOAT) / total_questions * 100) as best_score
-                FROM quiz_attempts 
-                WHERE user_id = ?
-            """, (user_id,)).fetchone()
-            
-            # Final test results
-            final_test = conn.execute("""
-                SELECT score, total_questions, passed, created_at
-                FROM final_test_attempts 
-                WHERE user_id = ?
-                ORDER BY created_at DESC LIMIT 1
+            # Trigger-maintained totals plus the latest final test, in one statement; the
+            # derived columns match aggregating the source tables (NULL for empty sums/averages)
+            row = conn.execute("""
+                SELECT COALESCE(s.lessons_attempted, 0) AS total_lessons_attempted,
+                       COALESCE(s.completed_lessons, 0) AS completed_lessons,
+                       CASE WHEN s.lessons_attempted > 0 THEN s.total_time_spent END AS total_time_spent,
+                       COALESCE(s.quizzes_taken, 0) AS total_quizzes_taken,
+                       s.sum_score_pct / NULLIF(s.scored_quizzes, 0) AS avg_score,
+                       s.best_score_pct AS best_score,
+                       f.score, f.total_questions, f.passed, f.created_at
+                FROM (SELECT ? AS user_id) AS me
+                LEFT JOIN user_stats s ON s.user_id = me.user_id
+                LEFT JOIN final_test_attempts f ON f.id = (
+                    SELECT id FROM final_test_attempts
+                    WHERE user_id = me.user_id
+                    ORDER BY created_at DESC LIMIT 1
+                )
             """, (user_id,)).fetchone()
-            
-            return {
-                'progress': dict(progress_stats) if progress_stats else {},
-                'quiz_performance': dict(quiz_stats) if quiz_stats else {},
-                'final_test': dict(final_test) if final_test else None
-            }
+        
+        return {
+            'progress': {
+                'total_lessons_attempted': row['total_lessons_attempted'],
+                'completed_lessons': row['completed_lessons'],
+                'total_time_spent': row['total_time_spent'],
+            },
+            'quiz_performance': {
+                'total_quizzes_taken': row['total_quizzes_taken'],
+                'avg_score': row['avg_score'],
+                'best_score': row['best_score'],
+            },
+            'final_test': {
+                'score': row['score'],
+                'total_questions': row['total_questions'],
+                'passed': row['passed'],
+                'created_at': row['created_at'],
+            } if row['score'] is not None else None
+        }
     
     # Data Migration Methods
     def migrate_lessons_from_csv(self, csv_file_path: str):
         """Migrate lesson data from CSV to database."""
-        import pandas as pd
-        
         if not os.path.exists(csv_file_path):
             return False
         
         try:
-            df = pd.read_csv(csv_file_path, encoding="ISO-8859-1")
-            
-            with self.get_connection() as conn:
-                for _, row in df.iterrows():
-                    conn.execute("""
+            with open(csv_file_path, "r", encoding="ISO-8859-1", newline="") as f:
+                # Rows are streamed straight into executemany; "001" is stored as "1"
+                rows = (
+                    (str(int(row['No'])) if row['No'].isdigit() else row['No'], row['Title'], row['Content'])
+                    for row in csv.DictReader(f)
+                )
+                
+                with self.get_connection(write=True) as conn:
+                    conn.executemany("""
                         INSERT OR REPLACE INTO lessons (lesson_no, title, content)
                         VALUES (?, ?, ?)
-                    """, (str(row['No']), row['Title'], row['Content']))
-                conn.commit()
+                    """, rows)
+                    conn.commit()
             return True
         except Exception as e:
             print(f"Error migrating lessons: {e}")
@@ -389,8 +924,7 @@ class DatabaseManager:
             if os.path.exists(completed_file):
                 with open(completed_file, 'r') as f:
                     completed_lessons = json.load(f)
-                    for lesson_no in completed_lessons:
-                        self.update_user_progress(user_id, lesson_no, is_completed=True)
+                self.mark_lessons_completed(user_id, completed_lessons)
             
             return True
         except Exception as e:
@@ -399,8 +933,26 @@ class DatabaseManager:
     
     # Utility Methods
     def _hash_password(self, password: str) -> str:
-        """Hash password using SHA-256."""
-        return hashlib.sha256(password.encode()).hexdigest()
+        """Hash password using salted scrypt."""
+        salt = os.urandom(16)
+        digest = hashlib.scrypt(password.encode(), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, dklen=32)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${digest.hex()}"
+    
+    def _verify_password(self, password: str, password_hash: str) -> bool:
+        """Check a password against a stored scrypt or legacy SHA-256 hash."""
+        if password_hash.startswith("scrypt$"):
+            _, n, r, p, salt, digest = password_hash.split("$")
+            n, r, p = int(n), int(r), int(p)
+            # Never let a stored hash ask for more work than we issue ourselves;
+            # this keeps the worst-case cost of a login at our own work factor
+            if n > SCRYPT_N or r > SCRYPT_R or p > SCRYPT_P:
+                return False
+            candidate = hashlib.scrypt(password.encode(), salt=bytes.fromhex(salt),
+                                       n=n, r=r, p=p, dklen=len(digest) // 2)
+            return hmac.compare_digest(candidate.hex(), digest)
+        
+        # Accounts created before the scrypt switch store an unsalted SHA-256 digest
+        return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), password_hash)
     
     def get_system_setting(self, key: str, default_value: str = None) -> str:
         """Get a system setting value."""
@@ -413,12 +965,43 @@ class DatabaseManager:
     
     def set_system_setting(self, key: str, value: str, description: str = None):
         """Set a system setting value."""
-        with self.get_connection() as conn:
+        with self.get_connection(write=True) as conn:
             conn.execute("""
                 INSERT OR REPLACE INTO system_settings (key, value, description, updated_at)
                 VALUES (?, ?, ?, CURRENT_TIMESTAMP)
             """, (key, value, description))
             conn.commit()
+    
+    def set_system_settings(self, settings: List[tuple]):
+        """Set several (key, value, description) settings in one transaction."""
+        with self.get_connection(write=True) as conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO system_settings (key, value, description, updated_at)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            """, settings)
+            conn.commit()
+    
+    # Quiz Cache Methods
+    def get_cached_quiz(self, key: bytes, max_age_seconds: int) -> Optional[List[Dict]]:
+        """Return a cached quiz no older than max_age_seconds, or None."""
+        with self.get_connection() as conn:
+            result = conn.execute("""
+                SELECT quizzes_json FROM quiz_cache WHERE key = ? AND created_at > ?
+            """, (key, int(time.time()) - max_age_seconds)).fetchone()
+        
+        return json.loads(result['quizzes_json']) if result else None
+    
+    def cache_quiz(self, key: bytes, quizzes: List[Dict], flush: bool = False):
+        """Store a generated quiz (deferred unless flush=True)."""
+        self._defer_write("""
+            INSERT OR REPLACE INTO quiz_cache (key, quizzes_json, created_at)
+            VALUES (?, ?, ?)
+        """, (key, json.dumps(quizzes), int(time.time())), flush)
+    
+    def cleanup_quiz_cache(self, max_age_seconds: int):
+        """Delete cached quizzes older than max_age_seconds (deferred)."""
+        self._defer_write("DELETE FROM quiz_cache WHERE created_at <= ?",
+                          (int(time.time()) - max_age_seconds,))
 
 # Global database instance
 db = DatabaseManager()
\ No newline at end of file
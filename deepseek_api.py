@@ -1,10 +1,24 @@
-<<<<<<< HEAD
-import requests
-from config import OPENAI_API_KEY  # 需要配置你的openai api key
+import json, time, requests
+from typing import List, Dict, Any
+from config import config, OPENAI_API_KEY  # 需要配置你的openai api key
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
 OPENAI_MODEL = "gpt-4o-mini"
 
+# Reuse connections + auto-retry (429/5xx/connection reset/read timeout)
+_SESSION = requests.Session()
+retry = Retry(
+    total=4,                # Total retry attempts
+    read=4, connect=4, backoff_factor=0.7,
+    status_forcelist=[429, 500, 502, 503, 504],
+    allowed_methods=["POST"]
+)
+_SESSION.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=retry))
+_HEADERS = config.get_api_headers()
+
+
 def call_openai(messages):
     headers = {
         "Authorization": f"Bearer {OPENAI_API_KEY}",
@@ -17,44 +31,45 @@ def call_openai(messages):
         "temperature": 0.4
     }
 
-    response = requests.post(OPENAI_API_URL, json=payload, headers=headers)
+    # Shares the keep-alive session, so repeat calls skip the TCP/TLS handshake
+    response = _SESSION.post(OPENAI_API_URL, json=payload, headers=headers, timeout=(8, 30))
 
     if response.status_code == 200:
         return response.json()["choices"][0]["message"]["content"]
     else:
         raise Exception(f"OpenAI API 调用失败: {response.status_code} - {response.text}")
-=======
-import time, requests
-from typing import List, Dict, Any
-from config import config
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 
-# Reuse connections + auto-retry (429/5xx/connection reset/read timeout)
-_SESSION = requests.Session()
-retry = Retry(
-    total=4,                # Total retry attempts
-    read=4, connect=4, backoff_factor=0.7,
-    status_forcelist=[429, 500, 502, 503, 504],
-    allowed_methods=["POST"]
-)
-_SESSION.mount("https://", HTTPAdapter(max_retries=retry))
-_HEADERS = config.get_api_headers()
 
+def _read_stream(resp) -> str:
+    """Join the content deltas of a server-sent-events response as they arrive."""
+    parts = []
+    # One "data: {json}" line per chunk, terminated by "data: [DONE]"; lines are
+    # kept as bytes since event streams often don't declare a charset
+    for line in resp.iter_lines():
+        if not line.startswith(b"data:"):
+            continue
+        data = line[len(b"data:"):].strip()
+        if data == b"[DONE]":
+            break
+        choices = json.loads(data).get("choices") or [{}]
+        content = choices[0].get("delta", {}).get("content")
+        if content:
+            parts.append(content)
+    return "".join(parts)
 
 
 def call_deepseek(messages: List[Dict[str, str]], temperature: float = None, max_tokens: int = None) -> str:
     """
     Call DeepSeek API with enhanced error handling and security.
-    
+
     Args:
         messages: List of message dictionaries for the conversation
         temperature: Override default temperature (optional)
         max_tokens: Override default max tokens (optional)
-    
+
     Returns:
         AI response content
-    
+
     Raises:
         Exception: If API call fails after retries
     """
@@ -62,28 +77,28 @@ def call_deepseek(messages: List[Dict[str, str]], temperature: float = None, max
         "model": config.DEEPSEEK_MODEL,
         "messages": messages,
         "temperature": temperature or config.DEFAULT_TEMPERATURE,
-        "max_tokens": max_tokens or config.DEFAULT_MAX_TOKENS
+        "max_tokens": max_tokens or config.DEFAULT_MAX_TOKENS,
+        "stream": True
     }
 
     def _post():
         # Set read timeout to 30s, connection timeout to 8s
-        return _SESSION.post(config.DEEPSEEK_API_URL, json=payload, headers=_HEADERS, timeout=(8, 30))
+        return _SESSION.post(config.DEEPSEEK_API_URL, json=payload, headers=_HEADERS, timeout=(8, 30),
+                             stream=True)
 
     last_text = ""
     for attempt in range(4):  # Work with Retry for additional safety
         try:
-            resp = _post()
-            last_text = resp.text
-            if resp.status_code == 200:
-                return resp.json()["choices"][0]["message"]["content"]
+            with _post() as resp:
+                if resp.status_code == 200:
+                    return _read_stream(resp)
+                last_text = resp.text
             # Non-retryable error: throw server response directly for easier debugging
             if resp.status_code not in (429, 500, 502, 503, 504):
                 raise Exception(f"API call failed: {resp.status_code} - {last_text}")
-        except (requests.ReadTimeout, requests.ConnectionError) as e:
+        except (requests.ReadTimeout, requests.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
             last_text = str(e)
         # Exponential backoff (stacks with urllib3 backoff for additional resilience)
         time.sleep(0.7 * (1.8 ** attempt))
 
     raise Exception(f"API call failed after multiple retries (timeout/failure) - {last_text}")
-
->>>>>>> c865a80 (更新说明，例如：fix bug / 添加功能)
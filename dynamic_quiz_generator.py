@@ -1,17 +1,13 @@
-<<<<<<< HEAD
-import requests
-import json
-import random
-from config import OPENAI_API_KEY, OPENAI_API_URL, OPENAI_MODEL
-
-API_URL = OPENAI_API_URL
-
-=======
+import hashlib
 import json
 import random
+import re
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from config import config
 from ai_api import call_deepseek
->>>>>>> c865a80 (更新说明，例如：fix bug / 添加功能)
+from database import db
 
 SYSTEM_PROMPT_TEMPLATE = """
 You are a professional exam question generator.
@@ -52,110 +48,128 @@ MOCK_QUIZZES = [
 ]
 
 # ✅ Determine question count based on content length
+# Seeded by the content so a lesson always gets the same count (and the same, cacheable prompt)
 def count_question_num(content: str) -> int:
+    rng = random.Random(zlib.crc32(content.encode("utf-8")))
     length = len(content)
     if length < 300:
-        return random.randint(1, 2)
+        return rng.randint(1, 2)
     elif length < 700:
-        return random.randint(3, 4)
+        return rng.randint(3, 4)
     elif length < 1200:
-        return random.randint(5, 7)
+        return rng.randint(5, 7)
     else:
-        return random.randint(8, 10)
+        return rng.randint(8, 10)
+
+# JSON object/array inside a ``` or ```json fence, found in a single scan
+_FENCE_RE = re.compile(r"```(?:json)?\s*(\{.*?\}|\[.*?\])\s*```", re.DOTALL)
 
 # ✅ Dynamic generation with batch control
-def generate_dynamic_quiz(lesson_title, lesson_content, num_questions=None):
-    if num_questions is None:
-        num_questions = count_question_num(lesson_content)
+# Batches are requested concurrently; this caps the number of calls in flight at once
+MAX_CONCURRENT_BATCHES = 10
+
+
+def _generate_batch(lesson_title, lesson_content, batch_size, batch_no, batch_count, regenerate):
+    """Generate one batch of questions, or return None if the response can't be used."""
+    system_prompt = SYSTEM_PROMPT_TEMPLATE.format(n=batch_size)
+    if batch_count > 1:
+        # Distinct prompts keep batches from repeating each other (and from sharing a cache entry)
+        system_prompt += f"\nThis is question set {batch_no} of {batch_count}; cover different facts than the other sets.\n"
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"Lesson Title: {lesson_title}\n\nLesson Content:\n{lesson_content}"}
+    ]
+
+    try:
+        # Use the new AI API with optimized parameters for quiz generation;
+        # quizzes are kept as long as explanations unless a regenerate is asked for
+        content = call_deepseek(
+            messages, temperature=0.8, max_tokens=800,
+            cache_ttl_minutes=config.LESSON_CACHE_DURATION_MINUTES, use_cache=not regenerate
+        )
+
+        # Clean up the response content
+        match = _FENCE_RE.search(content)
+        content = match.group(1) if match else content.strip()
 
-    batch_size = 10
-    total_quizzes = []
+        try:
+            data = json.loads(content)
+        except json.JSONDecodeError as e:
+            print("❌ JSON decode error:", e)
+            print("🔍 Raw content:", content)
+            return None
 
-    for batch_start in range(0, num_questions, batch_size):
-        current_batch_size = min(batch_size, num_questions - batch_start)
+        if isinstance(data, dict) and "quizzes" in data:
+            return data["quizzes"]
+        elif isinstance(data, list):
+            return data
+        else:
+            print("⚠️ Unexpected format:", data)
+            return None
 
-        system_prompt = SYSTEM_PROMPT_TEMPLATE.format(n=current_batch_size)
-<<<<<<< HEAD
-        payload = {
-            "model": OPENAI_MODEL,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Lesson Title: {lesson_title}\n\nLesson Content:\n{lesson_content}"}
-            ],
-            "temperature": 0.3
-        }
+    except Exception as e:
+        print("❌ Exception occurred:", e)
+        return None
 
-        headers = {
-            "Authorization": f"Bearer {OPENAI_API_KEY}",
-            "Content-Type": "application/json"
-        }
 
-        try:
-            response = requests.post(API_URL, json=payload, headers=headers)
-
-            if response.status_code == 200:
-                content = response.json()["choices"][0]["message"]["content"]
-
-                if "```json" in content:
-                    content = content.split("```json")[1].split("```")[0].strip()
-                elif "```" in content:
-                    content = content.split("```")[1].strip()
-
-                try:
-                    data = json.loads(content)
-                except json.JSONDecodeError as e:
-                    print("❌ JSON decode error:", e)
-                    print("🔍 Raw content:", content)
-                    return MOCK_QUIZZES
-
-                if isinstance(data, dict) and "quizzes" in data:
-                    total_quizzes.extend(data["quizzes"])
-                elif isinstance(data, list):
-                    total_quizzes.extend(data)
-                else:
-                    print("⚠️ Unexpected format:", data)
-                    return MOCK_QUIZZES
-
-            else:
-                print("❌ API Error:", response.status_code)
-                print(response.text)
-=======
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Lesson Title: {lesson_title}\n\nLesson Content:\n{lesson_content}"}
-        ]
+# Expired quiz_cache rows are purged this often, like ai_api's api_cache cleanup
+QUIZ_CACHE_CLEANUP_INTERVAL_SECONDS = 10 * 60
 
-        try:
-            # Use the new AI API with optimized parameters for quiz generation
-            content = call_deepseek(messages, temperature=0.8, max_tokens=800)
-
-            # Clean up the response content
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-            elif "```" in content:
-                content = content.split("```")[1].strip()
-
-            try:
-                data = json.loads(content)
-            except json.JSONDecodeError as e:
-                print("❌ JSON decode error:", e)
-                print("🔍 Raw content:", content)
-                return MOCK_QUIZZES
-
-            if isinstance(data, dict) and "quizzes" in data:
-                total_quizzes.extend(data["quizzes"])
-            elif isinstance(data, list):
-                total_quizzes.extend(data)
-            else:
-                print("⚠️ Unexpected format:", data)
->>>>>>> c865a80 (更新说明，例如：fix bug / 添加功能)
-                return MOCK_QUIZZES
-
-        except Exception as e:
-            print("❌ Exception occurred:", e)
-            return MOCK_QUIZZES
-
-    return total_quizzes
+
+def _schedule_quiz_cache_cleanup():
+    """Arm the timer for the next periodic quiz_cache cleanup."""
+    timer = threading.Timer(QUIZ_CACHE_CLEANUP_INTERVAL_SECONDS, _periodic_quiz_cache_cleanup)
+    timer.daemon = True
+    timer.start()
+
+
+def _periodic_quiz_cache_cleanup():
+    """Timer callback: drop quizzes past the lesson cache duration, then schedule the next run."""
+    db.cleanup_quiz_cache(config.LESSON_CACHE_DURATION_MINUTES * 60)
+    _schedule_quiz_cache_cleanup()
+
+
+_schedule_quiz_cache_cleanup()
+
+
+def _quiz_cache_key(lesson_title, lesson_content, num_questions):
+    """Digest identifying a quiz request in the quiz_cache table."""
+    return hashlib.blake2b(f"{lesson_title}|{num_questions}|{lesson_content}".encode("utf-8"),
+                           digest_size=16).digest()
+
+
+def generate_dynamic_quiz(lesson_title, lesson_content, num_questions=None, regenerate=False):
+    if num_questions is None:
+        num_questions = count_question_num(lesson_content)
+
+    # A finished quiz is reused as a whole, so a hit makes no API calls at all
+    cache_key = _quiz_cache_key(lesson_title, lesson_content, num_questions)
+    if not regenerate:
+        cached = db.get_cached_quiz(cache_key, config.LESSON_CACHE_DURATION_MINUTES * 60)
+        if cached is not None:
+            return cached
+
+    # Small batches return sooner and fit comfortably in the 800-token response budget
+    batch_size = 5
+    batch_sizes = [min(batch_size, num_questions - start) for start in range(0, num_questions, batch_size)]
+    if not batch_sizes:
+        return []
+
+    def run(batch):
+        batch_no, size = batch
+        return _generate_batch(lesson_title, lesson_content, size, batch_no, len(batch_sizes), regenerate)
+
+    if len(batch_sizes) == 1:
+        batches = [run((1, batch_sizes[0]))]
+    else:
+        with ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_BATCHES, len(batch_sizes))) as pool:
+            batches = list(pool.map(run, enumerate(batch_sizes, 1)))
+
+    if any(batch is None for batch in batches):
+        return MOCK_QUIZZES
+    quizzes = [quiz for batch in batches for quiz in batch]
+    db.cache_quiz(cache_key, quizzes)
+    return quizzes
 
 
 # ✅ Test
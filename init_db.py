@@ -3,15 +3,30 @@ Simple database initialization script without external dependencies
 """
 
 import sqlite3
-import hashlib
 import os
 
 DB_PATH = "notary_training.db"
 
+# scrypt hash of the default admin password "admin123", computed once ahead of time
+# (same scrypt$n$r$p$salt$digest format as DatabaseManager._hash_password)
+_ADMIN_PASSWORD_HASH = (
+    "scrypt$16384$8$1$9e3b6c8e7138eeabbdc6a5013d526c18$"
+    "5b3753ec28de4c5750ef5b0c51054208a311f98428e23af8c51ba3c6bbaa2653"
+)
+
 def init_database():
     """Initialize database with basic tables."""
+    is_new = not os.path.exists(DB_PATH)
     conn = sqlite3.connect(DB_PATH)
     
+    # Build the whole schema in one transaction without syncing. A brand-new file
+    # has nothing to protect, so it can skip the rollback journal as well
+    if is_new:
+        conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("BEGIN")
+    
     # Users table
     conn.execute("""
         CREATE TABLE IF NOT EXISTS users (
@@ -30,10 +45,10 @@ def init_database():
     # Sessions table
     conn.execute("""
         CREATE TABLE IF NOT EXISTS sessions (
-            id TEXT PRIMARY KEY,
+            id BLOB PRIMARY KEY,
             user_id INTEGER NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            expires_at TIMESTAMP NOT NULL,
+            expires_at INTEGER NOT NULL,  -- epoch seconds
             ip_address TEXT,
             user_agent TEXT,
             FOREIGN KEY (user_id) REFERENCES users (id)
@@ -45,6 +60,7 @@ def init_database():
         CREATE TABLE IF NOT EXISTS lessons (
             id INTEGER PRIMARY KEY,
             lesson_no TEXT UNIQUE NOT NULL,
+            lesson_no_int INTEGER GENERATED ALWAYS AS (CAST(lesson_no AS INTEGER)) VIRTUAL,
             title TEXT NOT NULL,
             content TEXT NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -126,7 +142,9 @@ def init_database():
         )
     """)
     
-    conn.commit()
+    # Bring databases created by an older version of this script up to date
+    _migrate_lessons_table(conn)
+    _migrate_sessions_table(conn)
     
     # Create indexes
     indexes = [
@@ -134,17 +152,65 @@ def init_database():
         "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)",
         "CREATE INDEX IF NOT EXISTS idx_progress_user_lesson ON user_progress (user_id, lesson_no)",
         "CREATE INDEX IF NOT EXISTS idx_quiz_user_lesson ON quiz_attempts (user_id, lesson_no)",
+        "CREATE INDEX IF NOT EXISTS idx_quiz_user_created ON quiz_attempts (user_id, created_at DESC)",
         "CREATE INDEX IF NOT EXISTS idx_qa_user_lesson ON qa_history (user_id, lesson_no)",
-        "CREATE INDEX IF NOT EXISTS idx_final_test_user ON final_test_attempts (user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_final_user_date ON final_test_attempts (user_id, created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_lessons_no_int ON lessons (lesson_no_int)",
+        "CREATE INDEX IF NOT EXISTS idx_users_created_at ON users (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_users_created_date ON users (DATE(created_at))",
+        # Covering indexes: these queries never touch the table rows
+        "CREATE INDEX IF NOT EXISTS idx_sessions_id_expires ON sessions (id, expires_at, user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_progress_user_cov ON user_progress (user_id, is_completed, time_spent)",
+        "CREATE INDEX IF NOT EXISTS idx_quiz_user_cov ON quiz_attempts (user_id, score, total_questions)",
+        # Superseded by idx_final_user_date
+        "DROP INDEX IF EXISTS idx_final_test_user",
     ]
     
     for index_sql in indexes:
         conn.execute(index_sql)
     
+    conn.execute("ANALYZE")
     conn.commit()
+    
+    # Back to the settings the app runs with
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
     conn.close()
     print("✅ Database initialized successfully!")
 
+def _migrate_lessons_table(conn):
+    """Add the numeric lesson_no_int column to databases created before it existed."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_xinfo(lessons)")}
+    if 'lesson_no_int' not in columns:
+        # ALTER TABLE can only add VIRTUAL columns; the index stores the computed values
+        conn.execute("""
+            ALTER TABLE lessons ADD COLUMN
+            lesson_no_int INTEGER GENERATED ALWAYS AS (CAST(lesson_no AS INTEGER)) VIRTUAL
+        """)
+        # The old expression index took this name; rebuild it on the column
+        conn.execute("DROP INDEX IF EXISTS idx_lessons_no_int")
+
+def _migrate_sessions_table(conn):
+    """Convert expiry times stored as datetime text to epoch seconds."""
+    # Text always sorts above integers in SQLite, so unconverted rows would never expire
+    conn.execute("""
+        UPDATE sessions SET expires_at = CAST(strftime('%s', expires_at) AS INTEGER)
+        WHERE typeof(expires_at) = 'text'
+    """)
+
+def _bootstrap_users(conn, users):
+    """Insert (username, password_hash, email, full_name, role) rows in one transaction.
+    
+    Existing usernames are left untouched. Returns the number of users created.
+    """
+    before = conn.total_changes
+    with conn:
+        conn.executemany("""
+            INSERT OR IGNORE INTO users (username, password_hash, email, full_name, role)
+            VALUES (?, ?, ?, ?, ?)
+        """, users)
+    return conn.total_changes - before
+
 def create_admin_user():
     """Create default admin user."""
     conn = sqlite3.connect(DB_PATH)
@@ -154,24 +220,14 @@ def create_admin_user():
     email = "admin@notary-training.com"
     full_name = "System Administrator"
     
-    # Hash password
-    password_hash = hashlib.sha256(password.encode()).hexdigest()
-    
-    try:
-        cursor = conn.execute("""
-            INSERT INTO users (username, password_hash, email, full_name, role)
-            VALUES (?, ?, ?, ?, ?)
-        """, (username, password_hash, email, full_name, "admin"))
-        
-        user_id = cursor.lastrowid
-        conn.commit()
+    if _bootstrap_users(conn, [(username, _ADMIN_PASSWORD_HASH, email, full_name, "admin")]):
+        user_id = conn.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()[0]
         
         print(f"✅ Admin user created successfully!")
         print(f"   Username: {username}")
         print(f"   Password: {password}")
         print(f"   User ID: {user_id}")
-        
-    except sqlite3.IntegrityError:
+    else:
         print("⚠️ Admin user already exists")
     
     conn.close()
@@ -185,22 +241,21 @@ def migrate_lessons_from_csv():
     try:
         import csv
         conn = sqlite3.connect(DB_PATH)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
         
-        with open("lessons.csv", "r", encoding="ISO-8859-1") as f:
-            reader = csv.DictReader(f)
-            count = 0
-            
-            for row in reader:
-                try:
-                    conn.execute("""
-                        INSERT OR REPLACE INTO lessons (lesson_no, title, content)
-                        VALUES (?, ?, ?)
-                    """, (str(row['No']), row['Title'], row['Content']))
-                    count += 1
-                except Exception as e:
-                    print(f"Error importing lesson {row.get('No', 'unknown')}: {e}")
-        
-        conn.commit()
+        with open("lessons.csv", "r", encoding="ISO-8859-1", newline="") as f:
+            # Stored like DatabaseManager.migrate_lessons_from_csv does: "001" becomes "1".
+            # Rows stream from the reader into one executemany, in one transaction
+            rows = (
+                (str(int(row['No'])) if row['No'].isdigit() else row['No'], row['Title'], row['Content'])
+                for row in csv.DictReader(f)
+            )
+            with conn:
+                count = conn.executemany("""
+                    INSERT OR REPLACE INTO lessons (lesson_no, title, content)
+                    VALUES (?, ?, ?)
+                """, rows).rowcount
         conn.close()
         print(f"✅ Imported {count} lessons from CSV")
         
@@ -5,7 +5,7 @@ Migrates existing CSV and JSON data to the new SQLite database.
 
 import os
 import json
-from database import db
+from database import db, UPSERT_PROGRESS_SQL
 from auth import AuthManager
 
 
@@ -36,7 +36,7 @@ def create_default_user():
     
     if user_id:
         # Update user role to admin
-        with db.get_connection() as conn:
+        with db.get_connection(write=True) as conn:
             conn.execute("UPDATE users SET role = 'admin' WHERE id = ?", (user_id,))
             conn.commit()
         print(f"✅ Default admin user created (ID: {user_id})")
@@ -63,9 +63,8 @@ def migrate_progress_data(user_id):
             with open("completed.json", "r") as f:
                 completed_lessons = json.load(f)
                 
-            for lesson_no in completed_lessons:
-                db.update_user_progress(user_id, lesson_no, is_completed=True)
-                migrated_items += 1
+            db.mark_lessons_completed(user_id, completed_lessons)
+            migrated_items += len(completed_lessons)
                 
             print(f"✅ Migrated {len(completed_lessons)} completed lessons")
         except Exception as e:
@@ -83,7 +82,18 @@ def migrate_progress_data(user_id):
             # For now, let's assume lesson numbers are sequential starting from "001"
             if current_index > 0:
                 current_lesson = f"{current_index:03d}"
-                db.update_user_progress(user_id, current_lesson, current_index=current_index)
+                # Written on this connection rather than through the write-behind queue,
+                # so it is part of main()'s migration transaction
+                with db.get_connection(write=True) as conn:
+                    conn.execute(UPSERT_PROGRESS_SQL, {
+                        'user_id': user_id,
+                        'lesson_no': current_lesson,
+                        'current_index': current_index,
+                        'is_completed': None,
+                        'completion_date': None,
+                        'time_spent': None,
+                    })
+                    conn.commit()
                 print(f"✅ Set current lesson to {current_lesson} (index {current_index})")
                 
         except Exception as e:
@@ -104,8 +114,7 @@ def set_system_settings():
         ("session_timeout_hours", "24", "User session timeout in hours"),
     ]
     
-    for key, value, description in settings:
-        db.set_system_setting(key, value, description)
+    db.set_system_settings(settings)
     
     print(f"✅ Set {len(settings)} system settings")
 
@@ -120,18 +129,20 @@ def main():
     db.init_database()
     print("✅ Database initialized!")
     
-    # Migrate lessons
-    migrate_lessons()
-    
-    # Create default user
-    user_id = create_default_user()
-    
-    # Migrate progress data if we have a user
-    if user_id:
-        migrate_progress_data(user_id)
-    
-    # Set system settings
-    set_system_settings()
+    # One write transaction (and one fsync) for every step below
+    with db.transaction():
+        # Migrate lessons
+        migrate_lessons()
+        
+        # Create default user
+        user_id = create_default_user()
+        
+        # Migrate progress data if we have a user
+        if user_id:
+            migrate_progress_data(user_id)
+        
+        # Set system settings
+        set_system_settings()
     
     print("=" * 60)
     print("🎉 Migration completed successfully!")
@@ -1,17 +1,26 @@
 # progress.py
 
-import json
 import os
 
+import orjson
+
 PROGRESS_FILE = "progress.json"
 
+# Index last read from or written to PROGRESS_FILE, so unchanged saves are skipped
+_saved_index = None
+
 def load_progress():
+    global _saved_index
     if os.path.exists(PROGRESS_FILE):
-        with open(PROGRESS_FILE, "r", encoding="ISO-8859-1") as f:
-            data = json.load(f)
-            return data.get("current_index", 0)
+        with open(PROGRESS_FILE, "rb") as f:
+            _saved_index = orjson.loads(f.read()).get("current_index", 0)
+            return _saved_index
     return 0
 
 def save_progress(index):
-    with open(PROGRESS_FILE, "w", encoding="ISO-8859-1") as f:
-        json.dump({"current_index": index}, f, indent=2)
+    global _saved_index
+    if index == _saved_index:
+        return
+    with open(PROGRESS_FILE, "wb") as f:
+        f.write(orjson.dumps({"current_index": index}))
+    _saved_index = index
@@ -48,11 +48,11 @@ def setup_openai_api():
     
     # Read current .env file
     env_file = ".env"
-    env_lines = []
+    content = ""
     
     if os.path.exists(env_file):
         with open(env_file, "r") as f:
-            env_lines = f.readlines()
+            content = f.read()
     
     # Update configuration
     new_config = {
@@ -62,30 +62,18 @@ def setup_openai_api():
         "ENABLE_RESPONSE_CACHING": "true"
     }
     
-    # Update or add configuration lines
-    updated_lines = []
-    updated_keys = set()
-    
-    for line in env_lines:
-        line = line.strip()
-        if "=" in line and not line.startswith("#"):
-            key = line.split("=")[0].strip()
-            if key in new_config:
-                updated_lines.append(f"{key}={new_config[key]}\n")
-                updated_keys.add(key)
-            else:
-                updated_lines.append(line + "\n")
-        else:
-            updated_lines.append(line + "\n")
-    
-    # Add new configuration lines that weren't in the file
+    # Substitute each key's line in place over the whole file, appending keys that are missing
     for key, value in new_config.items():
-        if key not in updated_keys:
-            updated_lines.append(f"{key}={value}\n")
+        line = f"{key}={value}"
+        content, found = re.subn(rf"(?m)^[ \t]*{re.escape(key)}[ \t]*=.*$", lambda _: line, content)
+        if not found:
+            if content and not content.endswith("\n"):
+                content += "\n"
+            content += line + "\n"
     
     # Write updated configuration
     with open(env_file, "w") as f:
-        f.writelines(updated_lines)
+        f.write(content)
     
     print(f"\n✅ Configuration updated successfully!")
     print(f"   Provider: OpenAI")
@@ -1,32 +1,68 @@
 # teaching_controller.py
 
-import pandas as pd
+import os
+import sys
+
+# Parsed lesson tables by CSV path, with the CSV mtime they were read at
+_frames = {}
+
+
+def _load_lessons(csv_path):
+    """Parse csv_path once per change: in-process first, then a pickle sidecar next to it."""
+    mtime = os.path.getmtime(csv_path)
+    cached = _frames.get(csv_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    # Imported here so modules that only import TeachingController skip pandas' start-up cost
+    import pandas as pd
+
+    sidecar = csv_path + ".pkl"
+    if os.path.exists(sidecar) and os.path.getmtime(sidecar) >= mtime:
+        df = pd.read_pickle(sidecar)
+    else:
+        df = pd.read_csv(csv_path, encoding='ISO-8859-1', engine='c')
+        try:
+            df.to_pickle(sidecar)
+        except OSError:
+            pass  # Read-only checkout: just parse the CSV again next time
+    _frames[csv_path] = (mtime, df)
+    return df
+
 
 class TeachingController:
     def __init__(self, csv_path):
-        df = pd.read_csv(csv_path, encoding='ISO-8859-1')
-        self.lessons = df.to_dict(orient="records")
+        df = _load_lessons(csv_path)
+        # Kept as columns rather than one dict per row; lessons are picked out by index
+        n = len(df)
+        self._no = df['No'].astype(str).to_numpy() if 'No' in df else [str(i) for i in range(1, n + 1)]
+        self._title = df['Title'].to_numpy() if 'Title' in df else [""] * n
+        self._content = df['Content'].to_numpy() if 'Content' in df else [""] * n
         self.index = 0
+        # The catalog never changes after loading, so it is formatted once here
+        self._catalog = "\n📚 教学目录：\n" + "".join(f"{i + 1}. {title}\n" for i, title in enumerate(self._title))
+
+    def __len__(self):
+        return len(self._no)
 
     def set_index(self, i):
-        if 0 <= i < len(self.lessons):
+        if 0 <= i < len(self):
             self.index = i
 
     def has_next(self):
-        return self.index < len(self.lessons)
+        return self.index < len(self)
 
     def next_lesson(self):
         if not self.has_next():
             return None
-        lesson = self.lessons[self.index]
+        i = self.index
         self.index += 1
         return {
-            "id": str(lesson.get("No", self.index)),
-            "title": lesson.get("Title", ""),
-            "content": lesson.get("Content", "")
+            "id": self._no[i],
+            "title": self._title[i],
+            "content": self._content[i]
         }
 
     def show_catalog(self):
-        print("\n📚 教学目录：")
-        for i, l in enumerate(self.lessons):
-            print(f"{i + 1}. {l.get('Title')}")
+        # One write instead of a print per lesson
+        sys.stdout.write(self._catalog)